@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+import random
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+# Capture time of the first frame, and the spacing of frames within and between bursts
+START_TIME = time.mktime((2024, 5, 1, 6, 30, 0, 0, 0, -1))
+FRAME_INTERVAL = 0.1
+BURST_INTERVAL = 30.0
+
+# RAW sidecars are random bytes, only their size matters
+RAW_EXTENSION = '.NEF'
+
+def make_scene(rng, width, height, noise):
+    """Return a (background, bird) pair: a noisy gradient image and the bird's (x, y, rx, ry, colour)."""
+    top = rng.integers(0, 256, 3)
+    bottom = rng.integers(0, 256, 3)
+    blend = np.linspace(0, 1, height, dtype=np.float32)[:, None, None]
+    pixels = np.broadcast_to(top * (1 - blend) + bottom * blend, (height, width, 3)).copy()
+    # Fine detail is what makes JPEGs big, noise sets how much of it there is
+    pixels += rng.normal(0, 255 * noise, (height, width, 3)).astype(np.float32)
+    background = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    bird = (int(rng.integers(width // 4, 3 * width // 4)), int(rng.integers(height // 4, 3 * height // 4)),
+            max(4, width // int(rng.integers(6, 16))), max(3, height // int(rng.integers(8, 20))),
+            tuple(int(c) for c in rng.integers(0, 256, 3)))
+    return background, bird
+
+def render_frame(background, bird, shift):
+    """Draw the bird on a copy of the background, moved by shift pixels."""
+    img = background.copy()
+    x, y, rx, ry, colour = bird
+    x += shift[0]
+    y += shift[1]
+    draw = ImageDraw.Draw(img)
+    draw.ellipse([x - rx, y - ry, x + rx, y + ry], fill=colour)
+    # A head, so the shape is not symmetric
+    draw.ellipse([x + rx // 2, y - ry - ry // 2, x + rx + rx // 3, y - ry // 3], fill=colour)
+    return img
+
+def exif_for(timestamp):
+    """EXIF with DateTimeOriginal and SubSecTimeOriginal, which burst grouping reads."""
+    exif = Image.Exif()
+    ifd = exif.get_ifd(0x8769)
+    ifd[36867] = time.strftime('%Y:%m:%d %H:%M:%S', time.localtime(timestamp))
+    ifd[37521] = f"{int(round(timestamp % 1 * 100)) % 100:02d}"
+    return exif
+
+def generate_corpus(directory, count=100, width=1600, height=1200, burst_length=1, max_burst_length=None,
+                    quality=90, noise=0.08, blur_fraction=0.0, raw_fraction=0.0, raw_bytes=20_000_000,
+                    subfolders=0, seed=0):
+    """Write count synthetic bird photos to directory and return a summary of what was written.
+
+    Photos come in bursts of burst_length to max_burst_length frames of the
+    same scene, taken FRAME_INTERVAL apart with the bird moving slightly, so
+    they group like real bursts. width, height, quality and noise set the
+    resolution and file sizes. blur_fraction of the frames are blurred,
+    raw_fraction of them get a RAW sidecar of raw_bytes, and with subfolders
+    the bursts are spread over that many subfolders. The same arguments
+    always give the same corpus.
+    """
+    directory = Path(directory)
+    rng = np.random.default_rng(seed)
+    pick = random.Random(seed)
+    max_burst_length = max(burst_length, max_burst_length or burst_length)
+    summary = {'images': 0, 'bursts': 0, 'blurred': 0, 'raw_sidecars': 0, 'bytes': 0}
+    timestamp = START_TIME
+    while summary['images'] < count:
+        length = min(pick.randint(burst_length, max_burst_length), count - summary['images'])
+        background, bird = make_scene(rng, width, height, noise)
+        folder = directory / f"card{summary['bursts'] % subfolders + 1}" if subfolders else directory
+        folder.mkdir(parents=True, exist_ok=True)
+        for frame in range(length):
+            img = render_frame(background, bird, (frame * 3, frame % 2))
+            if pick.random() < blur_fraction:
+                img = img.filter(ImageFilter.GaussianBlur(max(2, width // 300)))
+                summary['blurred'] += 1
+            path = folder / f"DSC_{summary['images'] + 1:05d}.JPG"
+            img.save(path, quality=quality, exif=exif_for(timestamp))
+            os.utime(path, (timestamp, timestamp))
+            summary['bytes'] += path.stat().st_size
+            if pick.random() < raw_fraction:
+                with open(path.with_suffix(RAW_EXTENSION), 'wb') as f:
+                    f.write(pick.randbytes(raw_bytes))
+                summary['raw_sidecars'] += 1
+                summary['bytes'] += raw_bytes
+            summary['images'] += 1
+            timestamp += FRAME_INTERVAL
+        summary['bursts'] += 1
+        timestamp += BURST_INTERVAL
+    return summary
+
+def add_corpus_arguments(parser):
+    parser.add_argument('--count', type=int, default=100, help="Number of photos")
+    parser.add_argument('--width', type=int, default=1600, help="Width of the photos in pixels")
+    parser.add_argument('--height', type=int, default=1200, help="Height of the photos in pixels")
+    parser.add_argument('--burst-length', type=int, default=1, help="Fewest frames per burst")
+    parser.add_argument('--max-burst-length', type=int, default=None,
+                        help="Most frames per burst (default: --burst-length)")
+    parser.add_argument('--quality', type=int, default=90, help="JPEG quality")
+    parser.add_argument('--noise', type=float, default=0.08,
+                        help="Amount of fine detail, from 0 upwards; more detail makes bigger files")
+    parser.add_argument('--blur-fraction', type=float, default=0.0, help="Fraction of blurred frames")
+    parser.add_argument('--raw-fraction', type=float, default=0.0, help="Fraction of frames with a RAW sidecar")
+    parser.add_argument('--raw-bytes', type=int, default=20_000_000, help="Size of each RAW sidecar")
+    parser.add_argument('--subfolders', type=int, default=0, help="Spread the bursts over this many subfolders")
+    parser.add_argument('--seed', type=int, default=0, help="Seed, the same seed gives the same corpus")
+
+def corpus_options(args):
+    return {
+        'count': args.count,
+        'width': args.width,
+        'height': args.height,
+        'burst_length': args.burst_length,
+        'max_burst_length': args.max_burst_length,
+        'quality': args.quality,
+        'noise': args.noise,
+        'blur_fraction': args.blur_fraction,
+        'raw_fraction': args.raw_fraction,
+        'raw_bytes': args.raw_bytes,
+        'subfolders': args.subfolders,
+        'seed': args.seed
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic corpus of bird photos for benchmarks")
+    parser.add_argument('directory', help="Folder to write the photos to")
+    add_corpus_arguments(parser)
+    args = parser.parse_args()
+    print(json.dumps(generate_corpus(args.directory, **corpus_options(args))))
+
+if __name__ == "__main__":
+    main()
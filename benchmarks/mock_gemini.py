@@ -0,0 +1,189 @@
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Species the stand-in names, picked by the hash of each image so an image always gets the same one
+SPECIES = [
+    "Indian Robin", "Oriental Magpie Robin", "Red-vented Bulbul", "Purple Sunbird", "Common Myna",
+    "White-throated Kingfisher", "Asian Koel", "Black Drongo", "Coppersmith Barbet", "Indian Peafowl",
+]
+# Tokens Gemini counts for an inline image up to 384 pixels, bigger ones are tiled
+TOKENS_PER_IMAGE = 258
+
+class MockGemini:
+    """Local stand-in for the generateContent endpoint, for benchmarks that don't spend API quota.
+
+    Every request waits latency seconds (times a log-normal factor with
+    sigma jitter, plus per_image_latency for each image) before it is
+    answered in the formats the identification and species info prompts ask
+    for. rate_limit_rate of the requests, and every request above
+    requests_per_minute, get a 429 with a Retry-After of retry_after seconds.
+    malformed_rate of the replies are broken: text that doesn't follow the
+    format, or a truncated body. stats() counts what was served.
+    """
+
+    def __init__(self, port=0, latency=0.5, jitter=0.3, per_image_latency=0.05, rate_limit_rate=0.0,
+                 requests_per_minute=None, retry_after=1.0, malformed_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.per_image_latency = per_image_latency
+        self.rate_limit_rate = rate_limit_rate
+        self.requests_per_minute = requests_per_minute
+        self.retry_after = retry_after
+        self.malformed_rate = malformed_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.recent = deque()
+        self.counts = {'requests': 0, 'images': 0, 'rate_limited': 0, 'malformed': 0, 'bytes_received': 0}
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                mock.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1beta"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def _count(self, name, n=1):
+        with self.lock:
+            self.counts[name] += n
+
+    def _draw(self):
+        """Return (rate limited, malformed, latency factor) for a request."""
+        with self.lock:
+            now = time.monotonic()
+            while self.recent and now - self.recent[0] > 60:
+                self.recent.popleft()
+            over_quota = self.requests_per_minute is not None and len(self.recent) >= self.requests_per_minute
+            if not over_quota:
+                self.recent.append(now)
+            return (over_quota or self.random.random() < self.rate_limit_rate,
+                    self.random.random() < self.malformed_rate,
+                    math.exp(self.random.gauss(0, self.jitter)) if self.jitter else 1.0)
+
+    def handle(self, request):
+        body = request.rfile.read(int(request.headers.get('Content-Length') or 0))
+        self._count('requests')
+        self._count('bytes_received', len(body))
+        if not re.search(r'/models/[^/:]+:generateContent', request.path):
+            return self._send(request, 404, {'error': {'code': 404, 'message': "Not found"}})
+        try:
+            parts = json.loads(body)['contents'][0]['parts']
+        except (ValueError, KeyError, IndexError):
+            return self._send(request, 400, {'error': {'code': 400, 'message': "Invalid JSON payload"}})
+
+        rate_limited, malformed, factor = self._draw()
+        if rate_limited:
+            self._count('rate_limited')
+            return self._send(request, 429, {'error': {'code': 429, 'message': "Resource has been exhausted"}},
+                              headers={'Retry-After': str(self.retry_after)})
+
+        prompt = parts[0].get('text', '')
+        images = [part['inline_data']['data'] for part in parts if 'inline_data' in part]
+        self._count('images', len(images))
+        time.sleep(self.latency * factor + self.per_image_latency * len(images))
+
+        if malformed:
+            self._count('malformed')
+            if self.random.random() < 0.5:
+                # Cut off mid-body, as when a connection drops
+                return self._send_raw(request, 200, b'{"candidates": [{"content": {"parts": [{"te')
+            return self._send(request, 200, self.reply("I'm not sure what this is.", prompt, len(images)))
+        return self._send(request, 200, self.reply(self.answer(prompt, images), prompt, len(images)))
+
+    def answer(self, prompt, images):
+        """Return the text the model would answer the prompt with."""
+        if prompt.startswith("For the bird species"):
+            name = re.search(r"'(.*?)'", prompt)
+            return (f"Scientific name: Avis {hashlib.sha256(prompt.encode()).hexdigest()[:6]}\n"
+                    f"Description: A synthetic {name.group(1) if name else 'bird'} for benchmarks.\n"
+                    f"Wikipedia link: https://en.wikipedia.org/wiki/Bird")
+        if prompt.startswith("Find the bird"):
+            # The middle half of the frame
+            return json.dumps({'box_2d': [250, 250, 750, 750]})
+        names = [SPECIES[int(hashlib.sha256(data.encode()).hexdigest(), 16) % len(SPECIES)] for data in images]
+        if len(images) > 1 or '"Image N"' in prompt:
+            return json.dumps([{'index': n, 'contains_bird': 'Yes', 'bird_name': name}
+                               for n, name in enumerate(names, 1)])
+        return f"Contains bird: Yes\nBird name: {names[0] if names else 'N/A'}"
+
+    def reply(self, text, prompt, image_count):
+        return {
+            'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}, 'finishReason': 'STOP'}],
+            'usageMetadata': {
+                'promptTokenCount': (len(prompt) + 3) // 4 + TOKENS_PER_IMAGE * image_count,
+                'candidatesTokenCount': (len(text) + 3) // 4
+            }
+        }
+
+    def _send(self, request, status, payload, headers=None):
+        self._send_raw(request, status, json.dumps(payload).encode('utf-8'), headers)
+
+    def _send_raw(self, request, status, body, headers=None):
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.end_headers()
+        request.wfile.write(body)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve a local stand-in for the Gemini generateContent endpoint. "
+                    "Point the app at it with --api-base-url."
+    )
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help="Median seconds before a reply")
+    parser.add_argument('--jitter', type=float, default=0.3, help="Sigma of the log-normal latency factor")
+    parser.add_argument('--per-image-latency', type=float, default=0.05, help="Extra seconds per image")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument('--requests-per-minute', type=int, default=None, help="Answer requests above this with 429")
+    parser.add_argument('--retry-after', type=float, default=1.0, help="Retry-After of the 429 replies")
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help="Fraction of broken replies")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    mock = MockGemini(args.port, args.latency, args.jitter, args.per_image_latency, args.rate_limit_rate,
+                      args.requests_per_minute, args.retry_after, args.malformed_rate, args.seed)
+    print(f"Serving on {mock.base_url}, stop with Ctrl+C")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(mock.stats()))
+        mock.server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.mock_gemini import MockGemini
+
+# Each scenario is a corpus, a mock server and classify_folder options. The
+# corpus and server options are added to the defaults of generate_corpus and
+# MockGemini.
+SCENARIOS = {
+    'baseline': {
+        'classify': {'concurrency': 4},
+    },
+    'batched': {
+        'classify': {'concurrency': 4, 'batch_size': 4},
+    },
+    'bursts': {
+        'corpus': {'burst_length': 3, 'max_burst_length': 8, 'blur_fraction': 0.3},
+        'classify': {'concurrency': 4, 'bursts': True},
+    },
+    'crop': {
+        'corpus': {'width': 6000, 'height': 4000, 'burst_length': 3, 'max_burst_length': 8},
+        'classify': {'concurrency': 4, 'bursts': True, 'crop': True},
+    },
+    'large-images': {
+        'corpus': {'width': 6000, 'height': 4000, 'quality': 95, 'raw_fraction': 0.5, 'raw_bytes': 25_000_000},
+        'classify': {'concurrency': 4},
+    },
+    'rate-limited': {
+        'server': {'requests_per_minute': 120, 'rate_limit_rate': 0.05},
+        'classify': {'concurrency': 8, 'adaptive': True, 'max_concurrency': 16},
+    },
+    'malformed': {
+        'server': {'malformed_rate': 0.1},
+        'classify': {'concurrency': 4, 'batch_size': 4},
+    },
+}
+
+API_KEY = 'benchmark'
+
+def percentile(values, fraction):
+    """The value below which fraction of the values fall, by nearest rank, or None without values."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+def peak_rss_bytes():
+    """Peak resident set size of this process and its finished children, or None where it can't be read."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Linux reports kilobytes, macOS bytes
+    unit = 1 if sys.platform == 'darwin' else 1024
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * unit
+
+class LatencyRecorder:
+    """Client observer keeping the latency of every successful API request."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+
+    def on_response(self, latency, status_code):
+        if status_code is not None and status_code < 400:
+            with self.lock:
+                self.latencies.append(latency)
+
+def run_classify(input_dir, options):
+    """Classify input_dir and return its measurements. Runs in the worker process."""
+    from classifier import classify_folder
+    from gemini_client import get_client
+
+    recorder = LatencyRecorder()
+    get_client().add_observer(recorder)
+    images = 0
+    failed = 0
+    uploaded = 0
+    start = time.perf_counter()
+    for msg in classify_folder(input_dir, API_KEY, **options):
+        if msg['type'] == 'result':
+            images += 1
+            failed += msg['status'] == 'failed'
+            uploaded += msg.get('uploaded_bytes') or 0
+        elif msg['type'] == 'error':
+            print(msg['text'], file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    return {
+        'images': images,
+        'failed': failed,
+        'seconds': round(elapsed, 3),
+        'images_per_second': round(images / elapsed, 2) if elapsed else None,
+        # Per request; every image of a batch waits as long as its request
+        'latency_p50_seconds': round(percentile(recorder.latencies, 0.5) or 0, 3),
+        'latency_p99_seconds': round(percentile(recorder.latencies, 0.99) or 0, 3),
+        'bytes_uploaded': uploaded,
+        'peak_rss_bytes': peak_rss_bytes()
+    }
+
+def run_distribute(input_dir):
+    """Distribute input_dir and return its measurements. Runs in the worker process."""
+    from classifier import distribute_folder
+    from photo_index import PhotoIndex
+
+    index = PhotoIndex()
+    try:
+        images = len(index.folder_photos(Path(input_dir) / '0000-bird-folders'))
+    finally:
+        index.close()
+    start = time.perf_counter()
+    for msg in distribute_folder(input_dir, API_KEY):
+        if msg['type'] == 'error':
+            print(msg['text'], file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    return {
+        'images': images,
+        'seconds': round(elapsed, 3),
+        'images_per_second': round(images / elapsed, 2) if elapsed else None,
+        'peak_rss_bytes': peak_rss_bytes()
+    }
+
+def run_phase(phase, input_dir, home, options, base_url=None):
+    """Run a phase in a fresh Python process, so its peak memory is its own, and return its measurements.
+
+    The process gets home as its home folder, so the app's cache and photo
+    index start empty and the user's own are left alone. The corpus is
+    generated in a phase of its own too: peak memory carries over to
+    processes started later, so generating large images here would show up
+    in the peaks of every phase after it.
+    """
+    env = dict(os.environ, HOME=str(home), USERPROFILE=str(home))
+    command = [sys.executable, '-m', 'benchmarks.run', '--phase', phase, '--input', str(input_dir),
+               '--options', json.dumps(options)]
+    if base_url:
+        command += ['--base-url', base_url]
+    output = subprocess.run(command, env=env, stdout=subprocess.PIPE, text=True, check=True,
+                            cwd=Path(__file__).resolve().parent.parent)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def run_scenario(name, count, seed=0):
+    """Generate the corpus of a scenario, classify and distribute it against a mock server."""
+    scenario = SCENARIOS[name]
+    with tempfile.TemporaryDirectory(prefix=f'bird-benchmark-{name}-') as tmp:
+        input_dir = Path(tmp) / 'photos'
+        home = Path(tmp) / 'home'
+        home.mkdir()
+        print(f"{name}: generating {count} photos", file=sys.stderr)
+        corpus = run_phase('corpus', input_dir, home, dict(scenario.get('corpus', {}), count=count, seed=seed))
+        mock = MockGemini(seed=seed, **scenario.get('server', {})).start()
+        try:
+            print(f"{name}: classifying", file=sys.stderr)
+            classify = run_phase('classify', input_dir, home, scenario.get('classify', {}), mock.base_url)
+            print(f"{name}: distributing", file=sys.stderr)
+            distribute = run_phase('distribute', input_dir, home, {}, mock.base_url)
+        finally:
+            mock.stop()
+        return {
+            'scenario': name,
+            'corpus': corpus,
+            'server': mock.stats(),
+            'classify': classify,
+            'distribute': distribute
+        }
+
+def format_result(result):
+    classify = result['classify']
+    distribute = result['distribute']
+    rss = classify['peak_rss_bytes']
+    return (f"{result['scenario']:<14} {classify['images_per_second']:>8} img/s  "
+            f"p50 {classify['latency_p50_seconds']:.3f}s  p99 {classify['latency_p99_seconds']:.3f}s  "
+            f"{classify['bytes_uploaded'] / 1e6:8.1f} MB up  "
+            f"{rss / 1e6 if rss else 0:7.1f} MB rss  {classify['failed']:>3} failed  "
+            f"distribute {distribute['images_per_second']:>8} img/s")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark classification and distribution on a synthetic corpus against a local mock "
+                    "of the Gemini API, without spending API quota"
+    )
+    parser.add_argument('scenarios', nargs='*', metavar='SCENARIO',
+                        help=f"Scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument('--count', type=int, default=100, help="Photos in each corpus")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the corpora and the mock server")
+    parser.add_argument('--output', default=None, metavar='FILE', help="Also write the results as JSON to FILE")
+    # Used by run_phase for the worker processes
+    parser.add_argument('--phase', choices=['corpus', 'classify', 'distribute'], help=argparse.SUPPRESS)
+    parser.add_argument('--input', help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    parser.add_argument('--options', default='{}', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase == 'corpus':
+        print(json.dumps(generate_corpus(args.input, **json.loads(args.options))))
+        return
+    if args.phase:
+        from gemini_client import configure_client
+
+        options = json.loads(args.options)
+        configure_client(base_url=args.base_url,
+                         pool_size=max(options.get('concurrency', 1), options.get('max_concurrency', 1)))
+        if args.phase == 'classify':
+            result = run_classify(args.input, options)
+        else:
+            result = run_distribute(args.input)
+        print(json.dumps(result))
+        return
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+    results = []
+    for name in args.scenarios or SCENARIOS:
+        result = run_scenario(name, args.count, args.seed)
+        print(format_result(result), file=sys.stderr)
+        print(json.dumps(result))
+        results.append(result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
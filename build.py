@@ -1,9 +1,16 @@
+import argparse
 import os
 import platform
 import subprocess
 import shutil
 
-def build_app():
+def build_app(onedir=False):
+    """Build dist/BirdClassifier.
+
+    By default the app is a single executable, which unpacks itself to a
+    temporary folder on every launch. With onedir it is a folder with the
+    executable next to its libraries, which starts much faster.
+    """
     # Install requirements
     subprocess.run(['pip', 'install', '-r', 'requirements.txt'])
     
@@ -13,20 +20,24 @@ def build_app():
     if os.path.exists('dist'):
         shutil.rmtree('dist')
     
-    # Build the application
-    subprocess.run(['pyinstaller', '--onefile', '--name=BirdClassifier', 'main.py'])
-    
-    # Create distribution folder
     dist_folder = 'dist/BirdClassifier'
-    if os.path.exists(dist_folder):
-        shutil.rmtree(dist_folder)
-    os.makedirs(dist_folder)
-    
-    # Copy the executable
-    if platform.system() == 'Windows':
-        shutil.copy('dist/BirdClassifier.exe', dist_folder)
+    if onedir:
+        # PyInstaller puts the executable and its libraries in dist_folder itself
+        subprocess.run(['pyinstaller', '--onedir', '--name=BirdClassifier', 'main.py'])
     else:
-        shutil.copy('dist/BirdClassifier', dist_folder)
+        # Build the application
+        subprocess.run(['pyinstaller', '--onefile', '--name=BirdClassifier', 'main.py'])
+        
+        # Create distribution folder
+        if os.path.exists(dist_folder):
+            shutil.rmtree(dist_folder)
+        os.makedirs(dist_folder)
+        
+        # Copy the executable
+        if platform.system() == 'Windows':
+            shutil.copy('dist/BirdClassifier.exe', dist_folder)
+        else:
+            shutil.copy('dist/BirdClassifier', dist_folder)
     
     # Copy the .env file
     shutil.copy('.env', dist_folder)
@@ -51,4 +62,7 @@ Note: The API key will be saved automatically after the first use.
     print(f"\nBuild completed! The application is in the {dist_folder} folder.")
 
 if __name__ == "__main__":
-    build_app() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build the Bird Photo Classifier with PyInstaller")
+    parser.add_argument('--onedir', action='store_true',
+                        help="Build a folder instead of a single executable, for a faster start")
+    build_app(parser.parse_args().onedir) 
\ No newline at end of file
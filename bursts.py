@@ -0,0 +1,88 @@
+import sys
+import threading
+from collections import deque
+
+# Frames further apart in time than this start a new burst
+DEFAULT_MAX_GAP = 2.0
+# Frames whose 64 bit dHash differs in more bits than this start a new burst
+DEFAULT_MAX_DISTANCE = 10
+# Longer runs of near-duplicates are split, so a burst's frames don't all wait in memory for its end
+DEFAULT_MAX_BURST_FRAMES = 30
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+def resolve_prepared(prepared):
+    """Turn the (image_path, future) pairs from ImagePreprocessor into (image_path, image) pairs.
+
+    image is None if the image could not be prepared.
+    """
+    for image_path, future in prepared:
+        try:
+            image = future.result()
+        except Exception as e:
+            # identify_bird will report the unreadable image
+            print(f"Error preparing {image_path}: {str(e)}", file=sys.stderr)
+            image = None
+        yield image_path, image
+
+def group_bursts(frames, max_gap=DEFAULT_MAX_GAP, max_distance=DEFAULT_MAX_DISTANCE,
+                 max_frames=DEFAULT_MAX_BURST_FRAMES):
+    """Group consecutive near-duplicate frames into bursts of at most max_frames.
+
+    frames yields (image_path, image) pairs as from resolve_prepared, this
+    yields lists of them. A frame joins the current burst when it was taken
+    within max_gap seconds of the previous frame and its perceptual hash is
+    within max_distance bits of the burst's first frame, so a long sequence
+    can't drift from one subject to another.
+    """
+    burst = []
+    previous = None
+    for image_path, image in frames:
+        if burst and (image is None or previous is None or len(burst) >= max_frames
+                      or abs(image.timestamp - previous.timestamp) > max_gap
+                      or hamming_distance(image.dhash, burst[0][1].dhash) > max_distance):
+            yield burst
+            burst = []
+        burst.append((image_path, image))
+        previous = image
+    if burst:
+        yield burst
+
+class BurstBoxCache:
+    """Bird bounding boxes of recently localized frames, reused by the other frames of their burst.
+
+    A frame taken within max_gap seconds of a cached frame, with a
+    perceptual hash within max_distance bits of it, gets that frame's box,
+    and joins the cache so the rest of a long burst finds it too. A box of
+    None (no bird found) is cached like any other. Frames are looked up from
+    several worker threads at once.
+    """
+
+    def __init__(self, max_gap=DEFAULT_MAX_GAP, max_distance=DEFAULT_MAX_DISTANCE, size=256):
+        self.max_gap = max_gap
+        self.max_distance = max_distance
+        self.lock = threading.Lock()
+        self.entries = deque(maxlen=size)
+
+    def get(self, image):
+        """Return (found, box) for a prepared image."""
+        with self.lock:
+            for timestamp, dhash, box in reversed(self.entries):
+                if (abs(image.timestamp - timestamp) <= self.max_gap
+                        and hamming_distance(image.dhash, dhash) <= self.max_distance):
+                    self.entries.append((image.timestamp, image.dhash, box))
+                    return True, box
+        return False, None
+
+    def put(self, image, box):
+        with self.lock:
+            self.entries.append((image.timestamp, image.dhash, box))
+
+def pick_representative(burst):
+    """Return the index of the sharpest frame in a burst."""
+    best = 0
+    for n, (_, image) in enumerate(burst):
+        if image and (burst[best][1] is None or image.sharpness > burst[best][1].sharpness):
+            best = n
+    return best
@@ -0,0 +1,72 @@
+import time
+from pathlib import Path
+
+from store import LRUStore
+
+# Where the app keeps data that is shared between folders
+APP_DIR = Path.home() / '.bird_classifier'
+
+DEFAULT_CACHE_PATH = APP_DIR / 'classification_cache.sqlite3'
+DEFAULT_MAX_ENTRIES = 100000
+
+class ClassificationCache(LRUStore):
+    """SQLite cache of parsed identify_bird results.
+
+    Entries are keyed by the sha256 of the image bytes and a version string
+    derived from the prompt and model, so renamed or copied files still hit
+    and a prompt change invalidates everything cached before it. When the
+    cache grows past max_entries the least recently used entries are evicted.
+    """
+
+    def __init__(self, version, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        super().__init__(path, [
+            """
+            CREATE TABLE IF NOT EXISTS classifications (
+                content_hash TEXT NOT NULL,
+                version TEXT NOT NULL,
+                contains_bird INTEGER NOT NULL,
+                bird_name TEXT,
+                is_blurred INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (content_hash, version)
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS classifications_last_used ON classifications (last_used)"
+        ], 'classifications', ['content_hash', 'version'], max_entries)
+        self.version = version
+        self.invalidate_stale()
+
+    def get(self, content_hash):
+        """Return the cached (contains_bird, bird_name, is_blurred) or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT contains_bird, bird_name, is_blurred FROM classifications WHERE content_hash = ? AND version = ?",
+                (content_hash, self.version)
+            ).fetchone()
+            if row is None:
+                return None
+            self.touch((content_hash, self.version), time.time())
+        return bool(row[0]), row[1], bool(row[2])
+
+    def put(self, content_hash, result):
+        """Store a (contains_bird, bird_name, is_blurred) result."""
+        contains_bird, bird_name, is_blurred = result
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO classifications VALUES (?, ?, ?, ?, ?, ?)",
+                (content_hash, self.version, int(contains_bird), bird_name, int(is_blurred), time.time())
+            )
+            self._commit()
+
+    def invalidate_stale(self):
+        """Drop entries written for another prompt or model version."""
+        with self.lock:
+            self.conn.execute("DELETE FROM classifications WHERE version != ?", (self.version,))
+            self.conn.commit()
+
+    def clear(self):
+        """Drop every cached entry."""
+        with self.lock:
+            self.touched = {}
+            self.conn.execute("DELETE FROM classifications")
+            self.conn.commit()
@@ -0,0 +1,980 @@
+import os
+import shutil
+from pathlib import Path
+import sys
+import re
+import time
+import base64
+import json
+import hashlib
+from collections import Counter
+from engine import run_in_order, chunked, AdaptiveConcurrency, DEFAULT_CONCURRENCY, DEFAULT_MAX_CONCURRENCY
+from preprocess import (get_gps_position, prepare_image, looks_blurred, ImagePreprocessor, shrink_image, crop_image,
+                        DEFAULT_MAX_EDGE, DEFAULT_QUALITY, DEFAULT_BLUR_THRESHOLD)
+from cache import ClassificationCache
+from manifest import JobManifest, PENDING, COPIED
+from gemini_client import get_client, ApiError
+from bursts import resolve_prepared, group_bursts, pick_representative, BurstBoxCache
+from species_info import get_species_info_store, SpeciesInfoPrefetcher, scientific_name
+from placement import place_file, COPY
+from photo_index import PhotoIndex
+from geocode import get_geocoder
+from usage import UsageStats, estimate_tokens
+from metrics import Metrics, timed, format_eta, DEFAULT_METRICS_DIR
+from scanner import BackgroundScanner, IMAGE_EXTENSIONS, RAW_EXTENSIONS
+from taxonomy import get_taxonomy
+from xmp import SidecarWriter, ADOBE
+
+# Try to load saved API key
+def load_saved_api_key():
+    try:
+        with open('api_key.json', 'r') as f:
+            data = json.load(f)
+            return data.get('api_key', '')
+    except (FileNotFoundError, json.JSONDecodeError):
+        return ''
+
+# Save API key
+def save_api_key(api_key):
+    with open('api_key.json', 'w') as f:
+        json.dump({'api_key': api_key}, f)
+
+def encode_image(image_path, max_edge=DEFAULT_MAX_EDGE, quality=DEFAULT_QUALITY, image=None):
+    """Encode image to base64 string, downscaled for upload. Returns (data, mime_type)."""
+    if image is None:
+        image = prepare_image(image_path, max_edge, quality)
+    return base64.b64encode(image.data).decode('utf-8'), image.mime_type
+
+GEMINI_MODEL = "gemini-2.0-flash"
+
+def call_gemini_api(api_key, prompt, image_path=None, image=None, images=None, generation_config=None,
+                    base_url=None):
+    """Make API call to Gemini.
+
+    image is an optional already prepared image (see preprocess.prepare_image)
+    to send instead of encoding image_path here. images is a list of prepared
+    images to send in one request, each labelled "Image N" in the order given.
+    base_url defaults to the one the shared client was configured with.
+    """
+    client = get_client()
+    url = f"{(base_url or client.base_url).rstrip('/')}/models/{GEMINI_MODEL}:generateContent?key={api_key}"
+    
+    parts = [{"text": prompt}]
+    if image_path or image:
+        image_data, mime_type = encode_image(image_path, image=image)
+        parts.append({
+            "inline_data": {
+                "mime_type": mime_type,
+                "data": image_data
+            }
+        })
+    for n, batch_image in enumerate(images or [], 1):
+        image_data, mime_type = encode_image(None, image=batch_image)
+        parts.append({"text": f"Image {n}:"})
+        parts.append({
+            "inline_data": {
+                "mime_type": mime_type,
+                "data": image_data
+            }
+        })
+    
+    data = {
+        "contents": [{
+            "parts": parts
+        }]
+    }
+    if generation_config:
+        data["generationConfig"] = generation_config
+    
+    # Raises ApiError once retries are exhausted
+    return client.post_json(url, data)
+
+def check_budget(usage):
+    """Raise ApiError instead of sending a request once the budget of the run is spent."""
+    if usage and usage.over_budget():
+        raise ApiError(f"Budget of ${usage.budget:.2f} reached")
+
+def get_bird_info(bird_name, api_key, usage=None):
+    """Get detailed information about a bird using Gemini API."""
+    try:
+        prompt = f"""For the bird species '{bird_name}', provide the following information in this exact format:
+        Scientific name: [Scientific name]
+        Description: [100 words about the bird's appearance, habitat, behavior, and characteristics]
+        Wikipedia link: [Wikipedia link]
+
+        Be specific and accurate. The description should be less than 100 words.
+        """
+        
+        check_budget(usage)
+        response = call_gemini_api(api_key, prompt)
+        if usage:
+            usage.record(response)
+        return response.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '')
+    except Exception as e:
+        return None
+
+def create_bird_info_file(bird_folder, bird_name, info_text):
+    """Create an info file for a bird species."""
+    info_file = bird_folder / "info.txt"
+    with open(info_file, "w", encoding="utf-8") as f:
+        f.write(f"Name: {bird_name}\n\n")
+        f.write(info_text)
+
+def get_new_filename(original_path, bird_name, is_blurred=False):
+    """Generate a new filename with bird name as suffix."""
+    # Get the original filename without extension
+    name = original_path.stem
+    # Get the extension
+    ext = original_path.suffix
+    # Create new filename with bird name as suffix
+    new_name = f"{name} {bird_name}"
+    if is_blurred:
+        new_name += " blurred"
+    new_name += ext
+    return new_name
+
+def species_from_filename(filename):
+    """Return the bird name in an output file name from get_new_filename, or None if it has none or is unidentified."""
+    # Format: original_name bird_name[ blurred].extension
+    name_parts = Path(filename).stem.split()
+    bird_name = " ".join(name_parts[1:]).split(".")[0]
+    if bird_name.endswith(" blurred"):
+        bird_name = bird_name[:-len(" blurred")]
+    if not bird_name or bird_name.lower() == "unidentified":
+        return None
+    return bird_name
+
+IDENTIFY_PROMPT = """Analyze this image and tell me:
+        1. Does this image contain a bird? (Yes/No)
+        2. If yes, what is the name of the bird? (If you can identify it)
+        Please respond in this exact format:
+        Contains bird: [Yes/No]
+        Bird name: [Name or N/A]
+        
+        Be exact in the name of the bird. Qualify the exact species. Be specific. Don't use scientific names.
+        {location_hint}
+
+        You have already identified the following birds: {known_birds} already. Check if this bird is one of them. If yes, make sure to return the exact same name.
+        The last bird you identified was {last_bird}. See if this bird is same as the last bird you identified.
+        """
+
+BATCH_IDENTIFY_PROMPT = """Analyze each of the {count} images below. Every image is preceded by its label "Image N". For each image tell me:
+        1. Does this image contain a bird? (Yes/No)
+        2. If yes, what is the name of the bird? (If you can identify it)
+        Respond with only a JSON array holding one object per image, in this exact format:
+        [{{"index": 1, "contains_bird": "Yes/No", "bird_name": "Name or N/A"}}]
+        
+        Be exact in the name of the bird. Qualify the exact species. Be specific. Don't use scientific names.
+        {location_hint}
+
+        You have already identified the following birds: {known_birds} already. Check if each bird is one of them. If yes, make sure to return the exact same name.
+        The last bird you identified was {last_bird}. Consecutive images are often of the same bird, see if they are the same as the last bird you identified.
+        """
+
+# Cached results are only reused while the model and the prompts they may have come from stay the same
+IDENTIFY_VERSION = hashlib.sha256(
+    f"{GEMINI_MODEL}\n{IDENTIFY_PROMPT}\n{BATCH_IDENTIFY_PROMPT}".encode('utf-8')
+).hexdigest()[:16]
+
+# The species named in the prompts as already identified: the most recent
+# ones first, then the most frequent ones, within a token budget
+CONTEXT_RECENT_SPECIES = 5
+CONTEXT_TOP_SPECIES = 30
+DEFAULT_CONTEXT_TOKENS = 150
+
+def build_species_context(loaded_birds, max_tokens=DEFAULT_CONTEXT_TOKENS):
+    """Return the (known_birds, last_bird) text for the identification prompts.
+
+    known_birds lists the CONTEXT_RECENT_SPECIES most recently identified
+    species, then the most frequent ones up to CONTEXT_TOP_SPECIES, cut off
+    at max_tokens. Ties are broken by name, so the same history always gives
+    the same prompt, and a long shoot doesn't grow the prompt.
+    """
+    birds = [bird for bird in loaded_birds if bird not in ["None", "Unidentified"]]
+    recent = []
+    for bird in reversed(birds):
+        if len(recent) == CONTEXT_RECENT_SPECIES:
+            break
+        if bird not in recent:
+            recent.append(bird)
+    counts = Counter(birds)
+    frequent = sorted(counts, key=lambda bird: (-counts[bird], bird))[:CONTEXT_TOP_SPECIES]
+    
+    known = []
+    for bird in recent + frequent:
+        if bird in known:
+            continue
+        if estimate_tokens(', '.join(known + [bird])) > max_tokens:
+            break
+        known.append(bird)
+    return ', '.join(known) or "none", loaded_birds[-1] if loaded_birds else "None"
+
+def open_classification_cache():
+    """Open the classification cache for the current prompt and model."""
+    return ClassificationCache(IDENTIFY_VERSION)
+
+def clean_bird_name(bird_name):
+    """Normalize a bird name returned by the API, None if there is no name."""
+    if bird_name.strip().lower() in ['n/a', 'na']:
+        return None
+    # Filter out non-alphabet characters
+    return re.sub(r'[^a-zA-Z\s]', '', bird_name).strip() or None
+
+def canonicalize_result(result, location=None):
+    """Replace the bird name of an identification result with its name in the taxonomy, if it is in it."""
+    if not result or not result[1]:
+        return result
+    return result[0], get_taxonomy().canonical_name(result[1], location) or result[1], result[2]
+
+def parse_identification(response_text):
+    """Parse the identify_bird response into (contains_bird, bird_name, is_blurred).
+
+    is_blurred is always False, blur is judged locally (see preprocess.looks_blurred).
+    """
+    contains_bird = "Contains bird: Yes" in response_text
+    bird_name = None
+    
+    for line in response_text.split('\n'):
+        if line.startswith('Bird name:'):
+            bird_name = clean_bird_name(line.replace('Bird name:', ''))
+    return contains_bird, bird_name, False
+
+def identify_bird(image_path, api_key, loaded_birds, location, image=None, cache=None,
+                  context_tokens=DEFAULT_CONTEXT_TOKENS, usage=None, metrics=None, cache_hits=None):
+    """Use Gemini API to identify if the image contains a bird and get its name.
+
+    Results are cached by image content, the content hashes of images found
+    in the cache are added to the cache_hits set if one is given. The name
+    is canonicalized with the taxonomy for location. Returns None if the request failed, so the
+    image is retried later instead of being filed as having no bird.
+    """
+    try:
+        if image is None:
+            image = prepare_image(image_path)
+        if cache:
+            cached = cache.get(image.content_hash)
+            if cached:
+                if metrics:
+                    metrics.count('cache_hits')
+                if cache_hits is not None:
+                    cache_hits.add(image.content_hash)
+                return canonicalize_result(cached, location)
+        
+        known_birds, last_bird = build_species_context(loaded_birds, context_tokens)
+        prompt = IDENTIFY_PROMPT.format(
+            location_hint=f"The probable location where the bird was shot is {location}. So it's likely to be a bird from that region." if location else "",
+            known_birds=known_birds,
+            last_bird=last_bird
+        )
+        
+        check_budget(usage)
+        with timed(metrics, 'network'):
+            response = call_gemini_api(api_key, prompt, image_path, image=image)
+        if usage:
+            usage.record(response, [image.content_hash], estimate_tokens(known_birds))
+        
+        # Parse the response
+        with timed(metrics, 'parse'):
+            response_text = response.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '')
+            result = parse_identification(response_text)
+        if cache:
+            cache.put(image.content_hash, result)
+        return canonicalize_result(result, location)
+    except ApiError as e:
+        print(f"Failed to identify {image_path}, retry later: {str(e)}", file=sys.stderr)
+        return None
+    except Exception as e:
+        print(f"Error processing {image_path}: {str(e)}", file=sys.stderr)
+        return False, None, False
+
+def parse_batch_identification(response_text, count):
+    """Parse a batched identification response into one result tuple per image.
+
+    Raises ValueError if the response is not a JSON array with exactly one
+    entry for each image index.
+    """
+    text = response_text.strip()
+    # Strip a markdown code fence around the JSON
+    if text.startswith('```'):
+        text = text.strip('`')
+        text = text[text.find('\n') + 1:] if '\n' in text else ''
+    entries = json.loads(text)
+    if not isinstance(entries, list):
+        raise ValueError("Batch response is not a list")
+    
+    results = {}
+    for entry in entries:
+        index = int(entry['index'])
+        if not 1 <= index <= count or index in results:
+            raise ValueError(f"Unexpected image index {index} in batch response")
+        results[index] = (
+            str(entry.get('contains_bird', '')).strip().lower() == 'yes',
+            clean_bird_name(str(entry.get('bird_name') or '')),
+            False
+        )
+    if len(results) != count:
+        raise ValueError(f"Batch response has {len(results)} results for {count} images")
+    return [results[index] for index in range(1, count + 1)]
+
+def identify_birds(image_paths, api_key, loaded_birds, location, images=None, cache=None,
+                   context_tokens=DEFAULT_CONTEXT_TOKENS, usage=None, metrics=None, cache_hits=None):
+    """Identify several images with a single API request.
+
+    Returns one (contains_bird, bird_name, is_blurred) tuple per image, in
+    order, or None for images whose request failed like identify_bird.
+    Cached images are left out of the request. If the batched response
+    can't be parsed, the images are identified one by one instead. Names
+    are canonicalized and cache hits reported like in identify_bird.
+    """
+    if images is None:
+        images = [None] * len(image_paths)
+    results = [None] * len(image_paths)
+    pending = []
+    for n, (image_path, image) in enumerate(zip(image_paths, images)):
+        try:
+            if image is None:
+                image = prepare_image(image_path)
+        except Exception as e:
+            print(f"Error processing {image_path}: {str(e)}", file=sys.stderr)
+            results[n] = (False, None, False)
+            continue
+        cached = cache.get(image.content_hash) if cache else None
+        if cached:
+            if metrics:
+                metrics.count('cache_hits')
+            if cache_hits is not None:
+                cache_hits.add(image.content_hash)
+            results[n] = canonicalize_result(cached, location)
+        else:
+            pending.append((n, image_path, image))
+    
+    if len(pending) == 1:
+        n, image_path, image = pending[0]
+        results[n] = identify_bird(image_path, api_key, loaded_birds, location, image=image, cache=cache,
+                                   context_tokens=context_tokens, usage=usage, metrics=metrics, cache_hits=cache_hits)
+    elif pending:
+        known_birds, last_bird = build_species_context(loaded_birds, context_tokens)
+        prompt = BATCH_IDENTIFY_PROMPT.format(
+            count=len(pending),
+            location_hint=f"The probable location where the birds were shot is {location}. So they are likely to be birds from that region." if location else "",
+            known_birds=known_birds,
+            last_bird=last_bird
+        )
+        try:
+            check_budget(usage)
+            with timed(metrics, 'network'):
+                response = call_gemini_api(api_key, prompt, images=[image for _, _, image in pending],
+                                           generation_config={"responseMimeType": "application/json"})
+        except ApiError as e:
+            for n, image_path, _ in pending:
+                print(f"Failed to identify {image_path}, retry later: {str(e)}", file=sys.stderr)
+                results[n] = None
+            return results
+        if usage:
+            usage.record(response, [image.content_hash for _, _, image in pending], estimate_tokens(known_birds))
+        
+        try:
+            with timed(metrics, 'parse'):
+                response_text = response.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '')
+                batch_results = parse_batch_identification(response_text, len(pending))
+        except (ValueError, KeyError, TypeError, AttributeError, IndexError) as e:
+            print(f"Malformed response for a batch of {len(pending)} images, identifying them one by one: {str(e)}", file=sys.stderr)
+            batch_results = None
+        
+        for k, (n, image_path, image) in enumerate(pending):
+            if batch_results:
+                if cache:
+                    cache.put(image.content_hash, batch_results[k])
+                results[n] = canonicalize_result(batch_results[k], location)
+            else:
+                results[n] = identify_bird(image_path, api_key, loaded_birds, location, image=image, cache=cache,
+                                           context_tokens=context_tokens, usage=usage, metrics=metrics,
+                                           cache_hits=cache_hits)
+    return results
+
+LOCALIZE_PROMPT = """Find the bird in this image. Respond with only JSON in this exact format:
+        {"box_2d": [ymin, xmin, ymax, xmax]}
+        with the coordinates normalized to 0-1000. If there are several birds, give the box of the largest one.
+        If there is no bird, respond with {"box_2d": null}.
+        """
+# Long edge of the image sent to find the bird, small enough to be a single image tile
+LOCALIZE_EDGE = 384
+
+def parse_box(response_text):
+    """Parse the locate_bird response into (top, left, bottom, right) fractions, or None if there is no bird.
+
+    Raises ValueError if the response is not a box in the requested format.
+    """
+    box = json.loads(response_text.strip().strip('`').removeprefix('json'))
+    if isinstance(box, list):
+        box = box[0] if box else {}
+    box = box.get('box_2d')
+    if box is None:
+        return None
+    top, left, bottom, right = (min(max(float(value) / 1000, 0.0), 1.0) for value in box)
+    if bottom <= top or right <= left:
+        raise ValueError(f"Empty box {box}")
+    return top, left, bottom, right
+
+def locate_bird(api_key, image, usage=None, metrics=None):
+    """Ask for the bounding box of the bird in a prepared image, see parse_box.
+
+    The image is sent at LOCALIZE_EDGE pixels, so the request is cheap.
+    Raises ApiError if the request fails and ValueError if the answer can't be parsed.
+    """
+    small = image._replace(data=shrink_image(image.data, LOCALIZE_EDGE), mime_type='image/jpeg')
+    check_budget(usage)
+    with timed(metrics, 'network'):
+        response = call_gemini_api(api_key, LOCALIZE_PROMPT, image=small,
+                                   generation_config={"responseMimeType": "application/json"})
+    if usage:
+        usage.record(response, [image.content_hash])
+    if metrics:
+        metrics.count('localized')
+    response_text = response.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '')
+    return parse_box(response_text), len(small.data)
+
+def crop_to_bird(image_path, image, api_key, boxes, executor=None, max_edge=DEFAULT_MAX_EDGE,
+                 quality=DEFAULT_QUALITY, usage=None, metrics=None):
+    """Return a prepared image whose upload is a full-resolution crop around the bird.
+
+    The bird is found with locate_bird, unless another frame of the same
+    burst was already localized (see bursts.BurstBoxCache). The crop is made
+    on executor if one is given. If no bird was found, the box covers most
+    of the frame or anything fails, the downscaled frame is sent as it was.
+    encoded_bytes includes the bytes sent to find the bird.
+    """
+    if image is None:
+        return image
+    found, box = boxes.get(image)
+    localize_bytes = 0
+    if not found:
+        try:
+            box, localize_bytes = locate_bird(api_key, image, usage, metrics)
+        except (ApiError, ValueError, KeyError, TypeError, AttributeError, IndexError) as e:
+            # Identification reports or retries a failing API
+            print(f"Could not find the bird in {image_path}, sending the whole frame: {str(e)}", file=sys.stderr)
+            return image
+        boxes.put(image, box)
+    crop = None
+    if box:
+        try:
+            if executor:
+                crop = executor.submit(crop_image, str(image_path), box, max_edge, quality).result()
+            else:
+                crop = crop_image(str(image_path), box, max_edge, quality)
+        except Exception as e:
+            print(f"Error cropping {image_path}: {str(e)}", file=sys.stderr)
+    if crop is None:
+        return image._replace(encoded_bytes=image.encoded_bytes + localize_bytes)
+    if metrics:
+        metrics.count('cropped')
+    return image._replace(data=crop, mime_type='image/jpeg', encoded_bytes=len(crop) + localize_bytes)
+
+def get_location_from_exif(image_path, image=None):
+    """Return a human-readable location from the GPS position in the image's EXIF data, or None.
+
+    The position is taken from the prepared image if there is one and looked
+    up in the local gazetteer, so no request leaves the machine.
+    """
+    if image:
+        position = image.position
+    else:
+        from PIL import Image
+
+        try:
+            with Image.open(image_path) as img:
+                position = get_gps_position(img)
+        except Exception as e:
+            print(f"Error extracting EXIF location: {str(e)}", file=sys.stderr)
+            return None
+    if position is None:
+        return None
+    return get_geocoder().locate(*position)
+
+def get_output_path(image_path, input_dir):
+    """Path to name an image's output after. Images in subfolders get the folders as a prefix, so names don't collide."""
+    relative = Path(image_path).relative_to(input_dir)
+    if len(relative.parts) == 1:
+        return Path(image_path)
+    prefix = '-'.join(part.replace(' ', '_') for part in relative.parts[:-1])
+    return Path(f"{prefix}-{relative.name}")
+
+def classify_folder(input_dir, api_key, location=None, concurrency=DEFAULT_CONCURRENCY,
+                    max_edge=DEFAULT_MAX_EDGE, quality=DEFAULT_QUALITY, use_cache=True, batch_size=1,
+                    bursts=False, blur_threshold=DEFAULT_BLUR_THRESHOLD, skip_threshold=None,
+                    previews=False, placement=COPY, direct=False, context_tokens=DEFAULT_CONTEXT_TOKENS,
+                    metrics=None, metrics_dir=DEFAULT_METRICS_DIR, budget=None, adaptive=False,
+                    max_concurrency=DEFAULT_MAX_CONCURRENCY, paths=None, pools=None, crop=False, xmp=False,
+                    xmp_naming=ADOBE):
+    """Classify the photos in input_dir and its subfolders and copy them into 0000-bird-folders.
+
+    RAW files follow the JPEG of the same name, placement picks how files
+    are placed (see placement.place_file) and xmp writes sidecars instead.
+    The other options tune blur, batching, bursts, cropping, concurrency,
+    budget and metrics as their names say.
+
+    This is a generator of messages in the GUI queue's format: 'progress'
+    and 'error' messages, a 'result' per image in file order and a final
+    'done' with a summary of the run. With previews, results carry the
+    upload bytes under 'preview'.
+    """
+    input_dir = Path(input_dir)
+    if not input_dir.exists():
+        yield {
+            'type': 'error',
+            'text': f"Input folder '{input_dir}' does not exist"
+        }
+        return
+    
+    start_time = time.time()
+    metrics = metrics or Metrics()
+    client_counters = get_client().counters()
+    controller = AdaptiveConcurrency(concurrency, maximum=max_concurrency) if adaptive else None
+    preprocessor = None
+    cache = None
+    manifest = None
+    prefetcher = None
+    index = None
+    try:
+        # Create output directory
+        output_dir = input_dir / '0000-bird-folders'
+        output_dir.mkdir(exist_ok=True)
+        
+        # Scan for images in the background, the total is known once the scan completes
+        scanner = BackgroundScanner(input_dir, paths)
+        sidecars = {}
+        
+        def key(image_path):
+            return Path(image_path).relative_to(input_dir).as_posix()
+        
+        # Pick up where an interrupted run left off
+        manifest = JobManifest(output_dir)
+        loaded_birds = list(manifest.loaded_birds)
+        resumed = 0
+        
+        def remaining_images():
+            nonlocal resumed
+            for item in scanner:
+                if manifest.state(key(item.path)) == COPIED:
+                    resumed += 1
+                    continue
+                sidecars[item.path] = item.sidecars
+                yield item.path
+        
+        def progress(i):
+            total = scanner.count if scanner.complete else f"{scanner.count}+"
+            text = f"image {resumed + i} of {total}"
+            rate = i / max(time.time() - start_time, 1e-6)
+            text += f" ({rate:.1f}/s"
+            if scanner.complete:
+                text += f", ETA {format_eta((scanner.count - resumed - i) / rate)}"
+            text += ")"
+            return (resumed + i) / max(scanner.count, 1) * 100, text
+        
+        # Get user's probable location
+        user_location = location.strip() if location else ''
+        if user_location:
+            user_location = f"Probably {user_location}"
+        
+        # Downscale images on a process pool, a few images ahead of the API calls
+        preprocessor = ImagePreprocessor(max_edge, quality, executor=pools.preprocess if pools else None)
+        # Skip the API for images classified in an earlier run
+        if use_cache:
+            cache = open_classification_cache()
+        lookahead = (max_concurrency if adaptive else concurrency) * max(1, batch_size) * 2
+        prepared = preprocessor.prepare_ahead(remaining_images(), lookahead=lookahead)
+        usage = UsageStats(GEMINI_MODEL, budget)
+        boxes = BurstBoxCache()
+        # Fetch info about each new species in the background, for distribution
+        prefetcher = SpeciesInfoPrefetcher(get_species_info_store(), lambda bird_name: get_bird_info(bird_name, api_key, usage))
+        # Sidecars wait for the scientific name of their species, which the prefetcher fetches
+        writer = None
+        if xmp:
+            writer = SidecarWriter(lambda bird_name: scientific_name(get_species_info_store().get(bird_name)), xmp_naming)
+        # Record where every photo went, for distribution and species queries
+        index = PhotoIndex()
+        bytes_saved = 0
+        species = {}
+        failed = 0
+        sources = {}
+        placements = {}
+        
+        def get_image_location(image_path, image):
+            # Get location from EXIF data, along with the user's input
+            image_location = get_location_from_exif(image_path, image)
+            if user_location:
+                # The EXIF location may be bare coordinates, which say less and match no regional checklist
+                image_location = f"{user_location}, {image_location}" if image_location else user_location
+            return image_location
+        
+        def make_task(batch):
+            # Snapshot the context now so the prompt doesn't depend on thread timing
+            context = list(loaded_birds)
+            recorded = [[manifest.result(key(image_path)) for image_path, _ in burst] for burst in batch]
+            def task():
+                # Only one frame of each burst is sent to the API
+                representatives = [pick_representative(burst) for burst in batch]
+                locations = [[get_image_location(image_path, image) for image_path, image in burst] for burst in batch]
+                burst_results = [recorded[b][r] for b, r in enumerate(representatives)]
+                
+                # Images classified before an interruption only miss the copy
+                todo = []
+                skipped = set()
+                for b, burst in enumerate(batch):
+                    representative = burst[representatives[b]][1]
+                    if burst_results[b]:
+                        continue
+                    if skip_threshold and representative and representative.sharpness < skip_threshold:
+                        # Too blurred to be worth a request
+                        burst_results[b] = (False, None, True)
+                        skipped.add(b)
+                    else:
+                        todo.append(b)
+                if todo and crop:
+                    for b in todo:
+                        image_path, image = batch[b][representatives[b]]
+                        if image and not (cache and cache.get(image.content_hash)):
+                            # The crop is what gets uploaded and previewed, the rest of the image stays as prepared
+                            batch[b][representatives[b]] = (image_path, crop_to_bird(
+                                image_path, image, api_key, boxes, preprocessor.executor, max_edge, quality,
+                                usage=usage, metrics=metrics))
+                cache_hits = set()
+                if todo:
+                    batch_location = next((locations[b][representatives[b]] for b in todo if locations[b][representatives[b]]), None)
+                    batch_results = identify_birds([batch[b][representatives[b]][0] for b in todo], api_key, context, batch_location,
+                                                   images=[batch[b][representatives[b]][1] for b in todo], cache=cache,
+                                                   context_tokens=context_tokens, usage=usage, metrics=metrics,
+                                                   cache_hits=cache_hits)
+                    for b, result in zip(todo, batch_results):
+                        burst_results[b] = result
+                
+                frames = []
+                for b, burst in enumerate(batch):
+                    for n, (image_path, image) in enumerate(burst):
+                        result = recorded[b][n]
+                        if result:
+                            source = 'recorded'
+                        else:
+                            result = burst_results[b]
+                            if b in skipped:
+                                source = 'skipped'
+                            elif n != representatives[b]:
+                                source = 'burst'
+                            elif image and image.content_hash in cache_hits:
+                                source = 'cache'
+                            else:
+                                source = 'api'
+                            if result and image:
+                                # Blur is judged per frame, from its own sharpness
+                                result = (result[0], result[1], looks_blurred(image, blur_threshold))
+                        frames.append((image_path, image, locations[b][n], result, source))
+                return frames
+            return task
+        
+        # Group frames into bursts, or treat every frame on its own
+        frames = resolve_prepared(prepared)
+        units = group_bursts(frames) if bursts else ([frame] for frame in frames)
+        # Identify images concurrently, results come back in file order
+        if controller:
+            get_client().add_observer(controller)
+        batches = run_in_order(chunked(units, max(1, batch_size)), make_task, controller or concurrency,
+                               executor=pools.requests if pools else None)
+        results = (frame for _, batch_frames in batches for frame in batch_frames)
+        for i, (image_path, image, image_location, result, source) in enumerate(results, 1):
+            value, counter = progress(i)
+            metrics.count('images')
+            if image:
+                for stage, seconds in image.timings.items():
+                    metrics.add_time(stage, seconds)
+            if result is None:
+                # Leave the image pending so the next run retries it
+                failed += 1
+                metrics.count('failed')
+                yield {
+                    'type': 'result',
+                    'value': value,
+                    'text': f"Processing {counter}: {image_path.name} (failed, will retry on the next run)",
+                    'index': resumed + i,
+                    'total': scanner.count if scanner.complete else None,
+                    'image': str(image_path),
+                    'status': 'failed',
+                    'location': image_location
+                }
+                continue
+            
+            contains_bird, bird_name, is_blurred = result
+            if manifest.state(key(image_path)) == PENDING:
+                manifest.mark_classified(key(image_path), result)
+            
+            saved = 0
+            uploaded = 0
+            sources[source] = sources.get(source, 0) + 1
+            if source != 'api':
+                # Never uploaded
+                saved = image.original_bytes if image else 0
+            elif image:
+                uploaded = image.encoded_bytes
+                saved = image.original_bytes - image.encoded_bytes
+            bytes_saved += saved
+            metrics.count('uploaded_bytes', uploaded)
+            
+            if not bird_name or bird_name in ["NA", "N/A", "Unidentified"]:
+                # Handle unidentified birds the same way as identified ones
+                bird_name = "Unidentified"
+            target_dir = output_dir
+            if direct and not writer and bird_name != "Unidentified":
+                target_dir = output_dir / bird_name
+                target_dir.mkdir(exist_ok=True)
+            # RAW sidecars go along with the image they belong to
+            files = [image_path] + sidecars.pop(image_path, [])
+            new_filenames = []
+            for path in files:
+                if writer:
+                    # Tagged where it is, the index points at the original
+                    new_filenames.append(Path(os.path.relpath(path, output_dir)).as_posix())
+                else:
+                    # Generate new filename with bird name as suffix (without location)
+                    new_filename = get_new_filename(get_output_path(path, input_dir), bird_name, is_blurred)
+                    # Copy (or link, or move) the file to the output directory with new name
+                    with metrics.time('copy'):
+                        placed = place_file(path, target_dir / new_filename, placement)
+                    placements[placed] = placements.get(placed, 0) + 1
+                    new_filenames.append((target_dir / new_filename).relative_to(output_dir).as_posix())
+                index.record(path, image.content_hash if image else None,
+                             bird_name if bird_name != "Unidentified" else None, is_blurred,
+                             image.timestamp if image else None, output_dir, new_filenames[-1])
+            new_filename = new_filenames[0]
+            loaded_birds.append(bird_name)
+            if writer:
+                # Done once its sidecar is written, with the rest of its batch
+                with metrics.time('xmp'):
+                    written = writer.add(files, bird_name if bird_name != "Unidentified" else None, is_blurred,
+                                         (key(image_path), new_filename, bird_name))
+                for entry in written:
+                    manifest.mark_copied(*entry)
+            else:
+                manifest.mark_copied(key(image_path), new_filename, bird_name)
+            species[bird_name] = species.get(bird_name, 0) + 1
+            if bird_name != "Unidentified":
+                prefetcher.request(bird_name)
+            
+            yield {
+                'type': 'result',
+                'value': value,
+                'text': f"Processing {counter}: {image_path.name} (saved {bytes_saved / 1024 / 1024:.1f} MB so far)",
+                'index': resumed + i,
+                'total': scanner.count if scanner.complete else None,
+                'image': str(image_path),
+                'status': 'classified',
+                'source': source,
+                'sharpness': round(image.sharpness, 1) if image else None,
+                'output': new_filename,
+                'sidecars': new_filenames[1:],
+                'location': image_location,
+                'contains_bird': contains_bird,
+                'bird_name': bird_name,
+                'is_blurred': is_blurred,
+                'uploaded_bytes': uploaded,
+                'saved_bytes': saved,
+                'usage': usage.pop_image(image.content_hash) if source == 'api' and image else None,
+                **({'preview': image.data} if previews and image else {})
+            }
+        
+        if prefetcher.pending():
+            yield {
+                'type': 'progress',
+                'value': 100,
+                'text': f"Fetching info for {prefetcher.pending()} species..."
+            }
+        prefetcher.close()
+        if writer:
+            with metrics.time('xmp'):
+                written = writer.flush(final=True)
+            for entry in written:
+                manifest.mark_copied(*entry)
+            # Left pending, the next run writes them
+            failed += writer.failed
+        elif direct:
+            write_info_files(output_dir, get_species_info_store())
+        
+        if failed and usage.over_budget():
+            text = f"Budget of ${budget:.2f} reached, {failed} images were left out. Start classification again to do them."
+        elif failed:
+            text = f"Classification completed, but {failed} images failed. Start classification again to retry them."
+        else:
+            # Nothing left to resume
+            manifest.remove()
+            if writer:
+                # Only held the manifest
+                try:
+                    output_dir.rmdir()
+                except OSError:
+                    pass
+                text = "Classification completed! The species are in XMP sidecars next to the photos."
+            elif direct:
+                text = "Classification completed! The photos are in their species folders."
+            else:
+                text = "Classification completed! Click 'Distribute into Folders' to organize the photos."
+        
+        metrics.add_time('scan', scanner.elapsed)
+        for name, value in get_client().counters().items():
+            metrics.count(f"api_{name}", value - client_counters.get(name, 0))
+        metrics_files = [str(path) for path in metrics.write(metrics_dir, input_dir.name)] if metrics_dir else []
+        
+        yield {
+            'type': 'done',
+            'value': 100,
+            'text': text,
+            'total': scanner.count,
+            'resumed': resumed,
+            'classified': scanner.count - resumed - failed,
+            'failed': failed,
+            'sources': sources,
+            'placements': placements,
+            'sidecars': writer.summary() if writer else None,
+            'species': species,
+            'bytes_saved': bytes_saved,
+            'usage': usage.summary(),
+            'concurrency': controller.window() if controller else concurrency,
+            'metrics': metrics.snapshot(),
+            'metrics_files': metrics_files,
+            'elapsed_seconds': round(time.time() - start_time, 3)
+        }
+    finally:
+        if controller:
+            get_client().remove_observer(controller)
+        if prefetcher:
+            prefetcher.close(wait=False)
+        if preprocessor:
+            preprocessor.close()
+        if cache:
+            cache.close()
+        if manifest:
+            manifest.close()
+        if index:
+            index.close()
+
+def place_late_raws(input_dir, pairs, placement=COPY, xmp_naming=ADOBE):
+    """Put RAW files beside the output of the image they belong to, which was classified before they arrived.
+
+    pairs are (RAW path, image path). Returns the pairs whose image is not
+    in the photo index, so not classified yet.
+    """
+    if not pairs:
+        return []
+    input_dir = Path(input_dir)
+    index = PhotoIndex()
+    waiting = []
+    try:
+        for raw_path, image_path in pairs:
+            photo = index.photo(image_path)
+            if photo is None:
+                waiting.append((raw_path, image_path))
+                continue
+            output = Path(photo.output)
+            if output.parts[0] == '..':
+                # Tagged in place, only the sidecar
+                writer = SidecarWriter(lambda bird_name: scientific_name(get_species_info_store().get(bird_name)),
+                                       xmp_naming)
+                writer.add([Path(image_path), Path(raw_path)], photo.species, photo.is_blurred)
+                writer.flush(final=True)
+                new_output = Path(os.path.relpath(raw_path, photo.folder)).as_posix()
+            else:
+                new_filename = get_new_filename(get_output_path(raw_path, input_dir), photo.species or "Unidentified",
+                                                photo.is_blurred)
+                place_file(raw_path, Path(photo.folder) / output.parent / new_filename, placement)
+                new_output = (output.parent / new_filename).as_posix()
+            index.record(raw_path, photo.content_hash, photo.species, photo.is_blurred, photo.timestamp,
+                         photo.folder, new_output)
+    finally:
+        index.close()
+    return waiting
+
+def write_info_files(output_dir, species_store):
+    """Write info.txt into every species folder that lacks one and whose info is in the store."""
+    for bird_folder in Path(output_dir).iterdir():
+        if bird_folder.is_dir() and not (bird_folder / "info.txt").exists():
+            info_text = species_store.get(bird_folder.name)
+            if info_text:
+                create_bird_info_file(bird_folder, bird_folder.name, info_text)
+
+def distribute_folder(input_dir, api_key):
+    """Move classified photos from 0000-bird-folders into one folder per bird.
+
+    The moves are planned from the photo index written by classify_folder.
+    Files the index doesn't know, classified before it existed or added by
+    hand, go by the bird name in their file name. Like
+    classify_folder this is a generator of GUI queue messages, ending with a
+    'done' message. info.txt files are written from the species info store,
+    which classification fills in the background. Species missing from the
+    store are fetched in the background too, and whatever is not ready by
+    the end of the distribution is written on the next one.
+    """
+    output_dir = Path(input_dir) / '0000-bird-folders'
+    
+    # Identified photos that are not in their species folder yet
+    index = PhotoIndex()
+    try:
+        photos = index.folder_photos(output_dir)
+        plan = [(photo.original, photo.species, photo.output) for photo in photos
+                if photo.species and '/' not in photo.output]
+        indexed = {photo.output for photo in photos}
+        if output_dir.is_dir():
+            for path in sorted(output_dir.iterdir()):
+                if (path.name not in indexed and path.suffix.lower() in IMAGE_EXTENSIONS + RAW_EXTENSIONS
+                        and path.is_file()):
+                    bird_name = species_from_filename(path.name)
+                    if bird_name:
+                        plan.append((None, bird_name, path.name))
+        
+        if not plan:
+            yield {
+                'type': 'error',
+                'text': "No images found to distribute"
+            }
+            return
+        
+        unique_birds = set()
+        moves = []
+        species_store = get_species_info_store()
+        prefetcher = SpeciesInfoPrefetcher(species_store, lambda bird_name: get_bird_info(bird_name, api_key))
+        try:
+            for i, (original, bird_name, output) in enumerate(plan, 1):
+                yield {
+                    'type': 'progress',
+                    'value': (i / len(plan)) * 100,
+                    'text': f"Processing image {i} of {len(plan)}: {output}"
+                }
+                
+                bird_folder = output_dir / bird_name
+                bird_folder.mkdir(exist_ok=True)
+                src = output_dir / output
+                dst = bird_folder / output
+                if src.exists():
+                    shutil.move(str(src), str(dst))
+                elif not dst.exists():
+                    # Deleted since it was classified
+                    continue
+                if original:
+                    moves.append((original, f"{bird_name}/{output}"))
+                unique_birds.add(bird_name)
+                
+                # Start fetching info for new species, without waiting for it
+                if not (bird_folder / "info.txt").exists() and species_store.get(bird_name) is None:
+                    prefetcher.request(bird_name)
+            
+            write_info_files(output_dir, species_store)
+        finally:
+            # Also record the moves made before an interruption
+            index.move_outputs(moves)
+            prefetcher.close(wait=False)
+    finally:
+        index.close()
+    
+    yield {
+        'type': 'done',
+        'value': 100,
+        'text': f"Distribution completed! Organized {len(unique_birds)} unique bird species.",
+        'species': sorted(unique_birds)
+    }
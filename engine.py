@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+
+DEFAULT_CONCURRENCY = 4
+# Most requests the adaptive controller lets into flight
+DEFAULT_MAX_CONCURRENCY = 16
+# A response this many times slower than the running average counts as a latency spike
+LATENCY_SPIKE_FACTOR = 3.0
+
+def chunked(items, size):
+    """Yield lists of up to `size` consecutive items."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+class AdaptiveConcurrency:
+    """AIMD controller for the number of API requests in flight.
+
+    Feed it every HTTP response with on_response (see GeminiClient.add_observer).
+    Each healthy response raises the limit by 1/limit, so by about one per
+    window of requests. A 429, a server or network error or a latency spike
+    halves it, at most once per average round trip, so a burst of errors
+    from one window only counts once.
+    """
+
+    def __init__(self, initial=DEFAULT_CONCURRENCY, minimum=1, maximum=DEFAULT_MAX_CONCURRENCY,
+                 latency_factor=LATENCY_SPIKE_FACTOR):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.latency_factor = latency_factor
+        self.latency = None
+        self.last_decrease = 0
+        self.lock = threading.Lock()
+
+    def window(self):
+        """Return the number of tasks that may be in flight now."""
+        with self.lock:
+            return int(self.limit)
+
+    def on_response(self, latency, status_code):
+        """Record one HTTP response; status_code is None for a network error."""
+        with self.lock:
+            now = time.monotonic()
+            failed = status_code is None or status_code == 429 or status_code >= 500
+            spike = self.latency is not None and latency > self.latency_factor * self.latency
+            if failed or spike:
+                if now - self.last_decrease > (self.latency or latency):
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self.last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            if not failed:
+                # Moving average, so a sustained change of pace becomes the new normal
+                self.latency = latency if self.latency is None else 0.9 * self.latency + 0.1 * latency
+
+class WorkerPools:
+    """A process pool for preprocessing and a thread pool for API requests, shared by several runs.
+
+    The request pool is sized for the most concurrent requests any run may
+    ask for, each run still keeps to its own window.
+    """
+
+    def __init__(self, max_requests=DEFAULT_MAX_CONCURRENCY, preprocess_workers=None):
+        self.requests = ThreadPoolExecutor(max_workers=max_requests)
+        self.preprocess = ProcessPoolExecutor(max_workers=preprocess_workers)
+
+    def close(self):
+        self.requests.shutdown(wait=True, cancel_futures=True)
+        self.preprocess.shutdown(wait=True, cancel_futures=True)
+
+def run_in_order(items, make_task, concurrency=DEFAULT_CONCURRENCY, executor=None):
+    """Run tasks on a worker pool and yield (item, result) in input order.
+
+    make_task(item) is called on the caller's thread right before the item is
+    submitted and must return a zero-argument callable to run on a worker.
+    At most `concurrency` tasks are in flight. A new item is only submitted
+    after the caller has consumed the oldest result, so any state the caller
+    updates between results (e.g. the list of loaded birds) is captured by
+    make_task at a deterministic point: item i always sees the results of
+    items before i - concurrency.
+
+    concurrency can also be an AdaptiveConcurrency, then the number of tasks
+    in flight follows its window and the point is no longer deterministic.
+    Tasks run on executor if one is given, e.g. the request pool of
+    WorkerPools, otherwise on a pool of their own.
+    """
+    if isinstance(concurrency, AdaptiveConcurrency):
+        window = concurrency.window
+        workers = concurrency.maximum
+    else:
+        workers = max(1, int(concurrency))
+        window = lambda: workers
+    items = iter(items)
+    pending = deque()
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=workers)
+
+    def submit_next():
+        for item in items:
+            pending.append((item, executor.submit(make_task(item))))
+            return True
+        return False
+
+    try:
+        # Fill the window
+        while len(pending) < window() and submit_next():
+            pass
+
+        while pending:
+            item, future = pending.popleft()
+            result = future.result()
+            yield item, result
+            # The caller has committed the result, top the window back up
+            while len(pending) < window() and submit_next():
+                pass
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+        else:
+            # Leave the shared pool running, but don't leave our tasks behind in it
+            for _, future in pending:
+                future.cancel()
+            wait([future for _, future in pending])
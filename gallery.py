@@ -0,0 +1,252 @@
+import bisect
+import io
+import os
+import subprocess
+import sys
+import tkinter as tk
+from collections import OrderedDict, namedtuple
+from pathlib import Path
+from queue import Queue, Empty
+from tkinter import ttk
+
+from photo_index import PhotoIndex
+from scanner import RAW_EXTENSIONS
+from thumbnails import ThumbnailCache, ThumbnailLoader, THUMBNAIL_SIZE
+
+HEADER_HEIGHT = 32
+CELL_PADDING = 8
+CELL_SIZE = THUMBNAIL_SIZE + CELL_PADDING
+# PhotoImages kept around for scrolling back, the visible ones are always kept
+MAX_PHOTO_IMAGES = 600
+# Milliseconds between checks for loaded thumbnails
+POLL_INTERVAL = 50
+
+# A photo in the gallery: where its file is, its content hash and its group
+GalleryItem = namedtuple('GalleryItem', ['path', 'content_hash', 'species', 'is_blurred'])
+
+def load_items(input_dir):
+    """Return the photos classified from input_dir, from the photo index, sorted into their groups."""
+    output_dir = Path(input_dir) / '0000-bird-folders'
+    index = PhotoIndex()
+    try:
+        photos = index.folder_photos(output_dir)
+    finally:
+        index.close()
+    items = [GalleryItem(os.path.join(photo.folder, photo.output), photo.content_hash, photo.species, photo.is_blurred)
+             for photo in photos if os.path.splitext(photo.output)[1].lower() not in RAW_EXTENSIONS]
+    # Species by name with the unidentified ones last, the sharp photos of a species before the blurred ones
+    items.sort(key=lambda item: (item.species is None, (item.species or '').lower(), item.is_blurred, item.path))
+    return items
+
+def open_file(path):
+    """Open a file with the application the system uses for it."""
+    if sys.platform.startswith('win'):
+        os.startfile(path)
+    elif sys.platform == 'darwin':
+        subprocess.Popen(['open', path])
+    else:
+        subprocess.Popen(['xdg-open', path])
+
+class ReviewGallery:
+    """Window showing the thumbnails of a classified folder, grouped by species and blur.
+
+    The grid is virtual: only the rows in view are drawn, and only their
+    thumbnails are loaded, from the ThumbnailCache or made on a background
+    pool. Scrolling through tens of thousands of photos only ever creates
+    a few screens worth of canvas items and images.
+    """
+
+    def __init__(self, parent, input_dir):
+        self.window = tk.Toplevel(parent)
+        self.window.title(f"Review - {Path(input_dir).name}")
+        self.window.geometry("900x700")
+
+        self.items = load_items(input_dir)
+        # Rows are (top, height, header text or list of item indexes), laid out for the window width
+        self.rows = []
+        self.row_tops = []
+        self.columns = 0
+        self.photos = OrderedDict()
+        self.ready = Queue()
+        self.redraw_pending = False
+        self.closed = False
+
+        species = {item.species for item in self.items if item.species}
+        self.summary_label = ttk.Label(self.window, text=f"{len(self.items)} photos, {len(species)} species")
+        self.summary_label.grid(row=0, column=0, columnspan=2, sticky=tk.W, padx=5, pady=5)
+
+        self.canvas = tk.Canvas(self.window, background='white', highlightthickness=0,
+                                yscrollincrement=CELL_SIZE // 4)
+        self.canvas.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.scrollbar = ttk.Scrollbar(self.window, orient=tk.VERTICAL, command=self.canvas.yview)
+        self.scrollbar.grid(row=1, column=1, sticky=(tk.N, tk.S))
+        self.canvas.configure(yscrollcommand=self.on_scroll)
+
+        self.status_label = ttk.Label(self.window, text="Click a photo to see its file, double-click to open it")
+        self.status_label.grid(row=2, column=0, columnspan=2, sticky=tk.W, padx=5, pady=5)
+
+        self.window.columnconfigure(0, weight=1)
+        self.window.rowconfigure(1, weight=1)
+
+        self.canvas.bind('<Configure>', lambda event: self.layout())
+        # Windows and macOS send MouseWheel, X11 sends buttons 4 and 5
+        self.canvas.bind('<MouseWheel>', lambda event: self.scroll(-1 if event.delta > 0 else 1))
+        self.canvas.bind('<Button-4>', lambda event: self.scroll(-1))
+        self.canvas.bind('<Button-5>', lambda event: self.scroll(1))
+        self.canvas.tag_bind('thumbnail', '<Button-1>', lambda event: self.on_click(event, False))
+        self.canvas.tag_bind('thumbnail', '<Double-Button-1>', lambda event: self.on_click(event, True))
+        self.window.protocol('WM_DELETE_WINDOW', self.close)
+
+        self.cache = ThumbnailCache()
+        self.loader = ThumbnailLoader(self.cache, self.on_thumbnail)
+        self.poll()
+
+    def layout(self):
+        """Lay the groups out in rows for the current width."""
+        columns = max(1, (self.canvas.winfo_width() - CELL_PADDING) // CELL_SIZE)
+        if columns == self.columns and self.rows:
+            self.schedule_redraw()
+            return
+        self.columns = columns
+        self.rows = []
+        top = 0
+        start = 0
+        while start < len(self.items):
+            group = (self.items[start].species, self.items[start].is_blurred)
+            end = start
+            while end < len(self.items) and (self.items[end].species, self.items[end].is_blurred) == group:
+                end += 1
+            title = group[0] or "Unidentified"
+            if group[1]:
+                title += " (blurred)"
+            self.rows.append((top, HEADER_HEIGHT, f"{title} - {end - start}"))
+            top += HEADER_HEIGHT
+            for row_start in range(start, end, columns):
+                self.rows.append((top, CELL_SIZE, list(range(row_start, min(row_start + columns, end)))))
+                top += CELL_SIZE
+            start = end
+        self.row_tops = [row[0] for row in self.rows]
+        self.canvas.configure(scrollregion=(0, 0, self.canvas.winfo_width(), top))
+        self.schedule_redraw()
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self.schedule_redraw()
+
+    def scroll(self, direction):
+        self.canvas.yview_scroll(direction * 3, 'units')
+
+    def schedule_redraw(self):
+        """Redraw once the pending events are handled, however many asked for it."""
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            self.window.after_idle(self.redraw)
+
+    def visible_rows(self):
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        first = max(0, bisect.bisect_right(self.row_tops, top) - 1)
+        last = bisect.bisect_left(self.row_tops, bottom)
+        return self.rows[first:last]
+
+    def redraw(self):
+        """Draw the rows in view, and ask for the thumbnails they are missing."""
+        self.redraw_pending = False
+        if self.closed:
+            return
+        self.canvas.delete('all')
+        if not self.items:
+            self.canvas.create_text(CELL_PADDING, CELL_PADDING, anchor=tk.NW,
+                                    text="No classified photos in this folder yet")
+        visible = []
+        missing = []
+        for top, height, content in self.visible_rows():
+            if isinstance(content, str):
+                self.canvas.create_text(CELL_PADDING, top + height // 2, text=content, anchor=tk.W,
+                                        font=('TkDefaultFont', 11, 'bold'))
+                continue
+            for column, n in enumerate(content):
+                item = self.items[n]
+                x = CELL_PADDING + column * CELL_SIZE + THUMBNAIL_SIZE // 2
+                y = top + CELL_SIZE // 2
+                visible.append(item.path)
+                tags = ('thumbnail', f"item{n}")
+                photo = self.photos.get(item.path)
+                if photo:
+                    self.photos.move_to_end(item.path)
+                    self.canvas.create_image(x, y, image=photo, tags=tags)
+                else:
+                    half = THUMBNAIL_SIZE // 2
+                    self.canvas.create_rectangle(x - half, y - half, x + half, y + half,
+                                                 fill='#eeeeee', outline='', tags=tags)
+                    if photo is None:
+                        missing.append(item)
+                    else:
+                        # Loaded already, but unreadable
+                        self.canvas.create_text(x, y, text="Missing", fill='grey', tags=tags)
+        self.loader.want(visible)
+        for item in missing:
+            self.loader.request(item.path, item.content_hash)
+        self.trim_photos(set(visible))
+
+    def trim_photos(self, visible):
+        """Forget the least recently shown images beyond MAX_PHOTO_IMAGES, except the visible ones."""
+        for path in list(self.photos):
+            if len(self.photos) <= MAX_PHOTO_IMAGES:
+                break
+            if path not in visible:
+                del self.photos[path]
+
+    def on_thumbnail(self, image_path, data):
+        """Decode a loaded thumbnail, on a loader thread, and hand it to the Tk thread."""
+        image = None
+        if data is not None:
+            from PIL import Image
+
+            try:
+                image = Image.open(io.BytesIO(data))
+                image.load()
+            except Exception as e:
+                print(f"Error decoding thumbnail of {image_path}: {str(e)}", file=sys.stderr)
+        self.ready.put((image_path, image))
+
+    def poll(self):
+        """Turn the thumbnails loaded since the last poll into PhotoImages."""
+        if self.closed:
+            return
+        loaded = False
+        try:
+            while True:
+                image_path, image = self.ready.get_nowait()
+                if image is None:
+                    # Marks the image as unreadable, so it is not requested again
+                    self.photos[image_path] = False
+                else:
+                    from PIL import ImageTk
+
+                    self.photos[image_path] = ImageTk.PhotoImage(image)
+                loaded = True
+        except Empty:
+            pass
+        if loaded:
+            self.schedule_redraw()
+        self.window.after(POLL_INTERVAL, self.poll)
+
+    def on_click(self, event, open_it):
+        current = self.canvas.find_withtag('current')
+        tags = self.canvas.gettags(current[0]) if current else ()
+        for tag in tags:
+            if tag.startswith('item'):
+                item = self.items[int(tag[4:])]
+                self.status_label.config(text=f"{item.species or 'Unidentified'}: {item.path}")
+                if open_it:
+                    try:
+                        open_file(item.path)
+                    except OSError as e:
+                        self.status_label.config(text=f"Error opening {item.path}: {str(e)}")
+
+    def close(self):
+        self.closed = True
+        self.loader.close()
+        self.cache.close()
+        self.window.destroy()
@@ -0,0 +1,193 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# Seconds to wait for the connection, and for the response
+DEFAULT_TIMEOUT = (10, 120)
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_POOL_SIZE = 32
+# Where the models are served, up to and including the API version
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+class ApiError(Exception):
+    """An API request that failed. retryable is True for quota, server and network errors."""
+
+    def __init__(self, message, status_code=None, retryable=False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+
+class TokenBucket:
+    """Thread safe token bucket allowing `rate` requests per second with bursts of `capacity`.
+
+    A rate of None disables the limit, but pause() still holds callers back.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate or 0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def pause(self, seconds):
+        """Hold back every caller for `seconds`, e.g. after the server asked us to slow down."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif not self.rate:
+                    return
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def parse_retry_after(value):
+    """Return the seconds a Retry-After header asks us to wait, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+class GeminiClient:
+    """Connection pooled HTTP client with rate limiting and retries.
+
+    One client is shared by all worker threads so TLS connections are reused
+    between requests. Quota (429), server and network errors, and responses
+    whose JSON is cut off, are retried with exponential backoff and jitter,
+    honoring Retry-After. A 429 also pauses the rate limiter so the other
+    workers back off too. counters() tells how many
+    requests were sent and retried since the client was created, and every
+    observer added with add_observer has on_response(latency, status_code)
+    called after each attempt, with a status_code of None for network errors.
+    base_url is where requests are sent, e.g. a local stand-in for the API
+    (see benchmarks/mock_gemini.py).
+    """
+
+    def __init__(self, requests_per_minute=None, max_retries=DEFAULT_MAX_RETRIES,
+                 timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE,
+                 backoff_base=1.0, backoff_max=60.0, base_url=DEFAULT_BASE_URL):
+        self.base_url = base_url.rstrip('/')
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(requests_per_minute / 60 if requests_per_minute else None)
+        # requests takes longer to import than the window takes to open, so it waits for the first client
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.counters_lock = threading.Lock()
+        self._counters = {'requests': 0, 'retries': 0, 'rate_limited': 0}
+        self.observers = []
+
+    def add_observer(self, observer):
+        with self.counters_lock:
+            self.observers = self.observers + [observer]
+
+    def remove_observer(self, observer):
+        with self.counters_lock:
+            self.observers = [o for o in self.observers if o is not observer]
+
+    def _notify(self, latency, status_code):
+        for observer in self.observers:
+            observer.on_response(latency, status_code)
+
+    def _count(self, name):
+        with self.counters_lock:
+            self._counters[name] += 1
+
+    def counters(self):
+        with self.counters_lock:
+            return dict(self._counters)
+
+    def post_json(self, url, data):
+        """POST data as JSON and return the decoded JSON response, raising ApiError on failure."""
+        import requests
+
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            retry_after = None
+            self._count('requests')
+            start = time.monotonic()
+            try:
+                response = self.session.post(url, json=data, timeout=self.timeout)
+                self._notify(time.monotonic() - start, response.status_code)
+                if response.status_code < 400:
+                    try:
+                        return response.json()
+                    except ValueError as e:
+                        # A body cut off on its way is worth another try like a network error
+                        raise ApiError(f"API response is not valid JSON: {str(e)}",
+                                       status_code=response.status_code, retryable=True)
+                error = ApiError(f"API request failed: {response.status_code} {response.reason}",
+                                 status_code=response.status_code,
+                                 retryable=response.status_code in RETRY_STATUS_CODES)
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self._notify(time.monotonic() - start, None)
+                error = ApiError(f"API request failed: {str(e)}", retryable=True)
+            except ApiError as e:
+                error = e
+            except (requests.exceptions.RequestException, ValueError) as e:
+                error = ApiError(f"API request failed: {str(e)}")
+
+            if not error.retryable or attempt >= self.max_retries:
+                raise error
+            attempt += 1
+            self._count('retries')
+            delay = retry_after
+            if delay is None:
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+            if error.status_code == 429:
+                self._count('rate_limited')
+                self.bucket.pause(delay)
+            time.sleep(delay)
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Return the shared client, creating it with default settings on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GeminiClient()
+        return _client
+
+def configure_client(**kwargs):
+    """Replace the shared client, see GeminiClient for the options."""
+    global _client
+    with _client_lock:
+        _client = GeminiClient(**kwargs)
+        return _client
@@ -0,0 +1,135 @@
+import math
+import sys
+import threading
+from pathlib import Path
+
+from cache import APP_DIR
+
+# A GeoNames dump, e.g. cities1000.txt from https://download.geonames.org/export/dump/
+DEFAULT_GAZETTEER_PATH = APP_DIR / 'cities1000.txt'
+# Optional GeoNames files next to the gazetteer for state and country names
+ADMIN1_FILE = 'admin1CodesASCII.txt'
+COUNTRY_FILE = 'countryInfo.txt'
+
+# Places are bucketed into cells of this many degrees, nearest place
+# lookups search the cell of the position and the 8 around it
+GRID_DEGREES = 1.0
+# Positions in the same cell of this many degrees share one lookup
+MEMO_DEGREES = 0.1
+# Further than this from any place, the position is reported as coordinates
+MAX_DISTANCE_KM = 100.0
+
+EARTH_RADIUS_KM = 6371.0
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Great circle distance between two positions."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def format_position(lat, lon):
+    return f"{abs(lat):.2f}°{'N' if lat >= 0 else 'S'} {abs(lon):.2f}°{'E' if lon >= 0 else 'W'}"
+
+def _grid_cell(lat, lon):
+    return int(math.floor(lat / GRID_DEGREES)), int(math.floor(lon / GRID_DEGREES)) % int(360 / GRID_DEGREES)
+
+def _read_names(path, key_column, name_column):
+    """Read a code to name mapping from a tab separated GeoNames file, empty if it is missing."""
+    names = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('#'):
+                    continue
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) > max(key_column, name_column):
+                    names[fields[key_column]] = fields[name_column]
+    except OSError:
+        pass
+    return names
+
+class ReverseGeocoder:
+    """Offline reverse geocoding from a local gazetteer.
+
+    The gazetteer is read on the first lookup into a grid of GRID_DEGREES
+    cells. Lookups are memoized per MEMO_DEGREES cell, using the place
+    nearest to the cell's center, so a whole shoot costs a handful of grid
+    searches. Without a gazetteer, or far from any place in it, the position
+    itself is the location.
+    """
+
+    def __init__(self, path=DEFAULT_GAZETTEER_PATH):
+        self.path = Path(path) if path else None
+        self.lock = threading.Lock()
+        self.grid = None
+        self.memo = {}
+
+    def _load(self):
+        self.grid = {}
+        if not self.path or not self.path.exists():
+            return
+        admin1 = _read_names(self.path.parent / ADMIN1_FILE, 0, 1)
+        countries = _read_names(self.path.parent / COUNTRY_FILE, 0, 4)
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    # geonameid, name, asciiname, alternatenames, latitude, longitude, ..., country code (8), ..., admin1 code (10)
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) < 11:
+                        continue
+                    try:
+                        lat, lon = float(fields[4]), float(fields[5])
+                    except ValueError:
+                        continue
+                    country = fields[8]
+                    parts = [fields[1], admin1.get(f"{country}.{fields[10]}"), countries.get(country, country)]
+                    name = ", ".join(part for part in parts if part)
+                    self.grid.setdefault(_grid_cell(lat, lon), []).append((lat, lon, name))
+        except OSError as e:
+            print(f"Error reading gazetteer {self.path}: {str(e)}", file=sys.stderr)
+
+    def nearest(self, lat, lon):
+        """Return (name, distance in km) of the nearest place in the gazetteer, or None."""
+        row, col = _grid_cell(lat, lon)
+        columns = int(360 / GRID_DEGREES)
+        best = None
+        for d_row in (-1, 0, 1):
+            for d_col in (-1, 0, 1):
+                for place_lat, place_lon, name in self.grid.get((row + d_row, (col + d_col) % columns), []):
+                    distance = distance_km(lat, lon, place_lat, place_lon)
+                    if best is None or distance < best[1]:
+                        best = (name, distance)
+        return best
+
+    def locate(self, lat, lon):
+        """Return a human-readable location for a position."""
+        key = (int(math.floor(lat / MEMO_DEGREES)), int(math.floor(lon / MEMO_DEGREES)))
+        with self.lock:
+            if key not in self.memo:
+                if self.grid is None:
+                    self._load()
+                center_lat, center_lon = (key[0] + 0.5) * MEMO_DEGREES, (key[1] + 0.5) * MEMO_DEGREES
+                place = self.nearest(center_lat, center_lon)
+                if place and place[1] <= MAX_DISTANCE_KM:
+                    self.memo[key] = f"near {place[0]}"
+                else:
+                    self.memo[key] = format_position(center_lat, center_lon)
+            return self.memo[key]
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+def configure_geocoder(path=DEFAULT_GAZETTEER_PATH):
+    """Use the gazetteer at path from now on."""
+    global _geocoder
+    with _geocoder_lock:
+        _geocoder = ReverseGeocoder(path)
+        return _geocoder
+
+def get_geocoder():
+    """Return the shared geocoder, reading DEFAULT_GAZETTEER_PATH unless configured otherwise."""
+    global _geocoder
+    with _geocoder_lock:
+        if _geocoder is None:
+            _geocoder = ReverseGeocoder()
+        return _geocoder
@@ -0,0 +1,532 @@
+import io
+import os
+import time
+from pathlib import Path
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox
+import threading
+from queue import Queue, Empty
+from classifier import load_saved_api_key, save_api_key, classify_folder, distribute_folder, DEFAULT_CONCURRENCY
+from placement import STRATEGIES, COPY
+from metrics import Metrics, timed
+from jobs import JobQueue, JobRunner
+from gallery import ReviewGallery
+
+PREVIEW_SIZE = (400, 400)
+# Most preview updates per second while classifying
+PREVIEW_FPS = 5
+# Set to a file path to have the time the window first showed written to it, then quit. See startup_benchmark.py
+STARTUP_BENCHMARK_ENV = 'BIRD_CLASSIFIER_STARTUP_BENCHMARK'
+
+def load_preview(source):
+    """Decode a preview sized image from a file path or encoded image bytes."""
+    # Pillow is imported on first use, so it doesn't hold up the window
+    from PIL import Image, ImageOps
+
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    img = Image.open(source)
+    # Let the JPEG decoder scale down while decoding
+    img.draft('RGB', PREVIEW_SIZE)
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail(PREVIEW_SIZE)
+    return img
+
+class BirdClassifierGUI:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("Bird Photo Classifier")
+        self.root.geometry("800x600")
+        
+        # Create main frame
+        main_frame = ttk.Frame(root, padding="10")
+        main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        
+        # API Key frame
+        api_frame = ttk.Frame(main_frame)
+        api_frame.grid(row=0, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=5)
+        
+        ttk.Label(api_frame, text="Google API Key:").pack(side=tk.LEFT, padx=5)
+        self.api_key_var = tk.StringVar(value=load_saved_api_key())
+        self.api_key_entry = ttk.Entry(api_frame, textvariable=self.api_key_var, width=50, show="*")
+        self.api_key_entry.pack(side=tk.LEFT, padx=5)
+        
+        # Folder selection
+        folder_frame = ttk.Frame(main_frame)
+        folder_frame.grid(row=1, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=5)
+        
+        ttk.Label(folder_frame, text="Input Folder:").pack(side=tk.LEFT, padx=5)
+        self.folder_path = tk.StringVar()
+        ttk.Entry(folder_frame, textvariable=self.folder_path, width=50).pack(side=tk.LEFT, padx=5)
+        ttk.Button(folder_frame, text="Browse", command=self.browse_folder).pack(side=tk.LEFT, padx=5)
+        
+        # Location input
+        location_frame = ttk.Frame(main_frame)
+        location_frame.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=5)
+        
+        ttk.Label(location_frame, text="Probable Location:").pack(side=tk.LEFT, padx=5)
+        self.location_var = tk.StringVar()
+        ttk.Entry(location_frame, textvariable=self.location_var, width=50).pack(side=tk.LEFT, padx=5)
+        
+        # Classification options
+        options_frame = ttk.Frame(main_frame)
+        options_frame.grid(row=3, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=5)
+        
+        # Number of images sent to the API at the same time
+        ttk.Label(options_frame, text="Concurrent Requests:").pack(side=tk.LEFT, padx=5)
+        self.concurrency_var = tk.IntVar(value=DEFAULT_CONCURRENCY)
+        ttk.Spinbox(options_frame, from_=1, to=32, textvariable=self.concurrency_var, width=5).pack(side=tk.LEFT, padx=5)
+        # Let the number of concurrent requests follow what the API sustains
+        self.adaptive_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Adaptive", variable=self.adaptive_var).pack(side=tk.LEFT, padx=5)
+        
+        # Number of images identified in one API request
+        ttk.Label(options_frame, text="Images per Request:").pack(side=tk.LEFT, padx=5)
+        self.batch_size_var = tk.IntVar(value=1)
+        ttk.Spinbox(options_frame, from_=1, to=16, textvariable=self.batch_size_var, width=5).pack(side=tk.LEFT, padx=5)
+        
+        # Burst grouping
+        self.bursts_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Group Bursts", variable=self.bursts_var).pack(side=tk.LEFT, padx=5)
+        
+        # Two-stage identification on a crop around the bird
+        self.crop_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Crop to Bird", variable=self.crop_var).pack(side=tk.LEFT, padx=5)
+        
+        # How photos are put into the output folder
+        ttk.Label(options_frame, text="Placement:").pack(side=tk.LEFT, padx=5)
+        self.placement_var = tk.StringVar(value=COPY)
+        ttk.Combobox(options_frame, textvariable=self.placement_var, values=STRATEGIES, state='readonly', width=9).pack(side=tk.LEFT, padx=5)
+        
+        # Put photos straight into species folders
+        self.direct_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Straight into Species Folders", variable=self.direct_var).pack(side=tk.LEFT, padx=5)
+        
+        # Tag the originals in XMP sidecars instead of copying them
+        self.xmp_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Tag XMP Sidecars", variable=self.xmp_var).pack(side=tk.LEFT, padx=5)
+        
+        # Buttons frame
+        buttons_frame = ttk.Frame(main_frame)
+        buttons_frame.grid(row=4, column=0, columnspan=2, pady=10)
+        
+        # Start button
+        self.start_button = ttk.Button(buttons_frame, text="Start Classification", command=self.start_classification)
+        self.start_button.pack(side=tk.LEFT, padx=5)
+        
+        # Distribute button (initially disabled)
+        self.distribute_button = ttk.Button(buttons_frame, text="Distribute into Folders", command=self.distribute_photos, state='disabled')
+        self.distribute_button.pack(side=tk.LEFT, padx=5)
+        
+        # Queue the folder to classify later, with the others
+        self.add_job_button = ttk.Button(buttons_frame, text="Add to Queue", command=self.add_job, state='disabled')
+        self.add_job_button.pack(side=tk.LEFT, padx=5)
+        
+        # Thumbnails of the classified photos, by species
+        self.review_button = ttk.Button(buttons_frame, text="Review Results", command=self.review_results, state='disabled')
+        self.review_button.pack(side=tk.LEFT, padx=5)
+        
+        # Progress frame
+        progress_frame = ttk.LabelFrame(main_frame, text="Progress", padding="5")
+        progress_frame.grid(row=5, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=5)
+        
+        self.progress_var = tk.DoubleVar()
+        self.progress_bar = ttk.Progressbar(progress_frame, variable=self.progress_var, maximum=100)
+        self.progress_bar.grid(row=0, column=0, sticky=(tk.W, tk.E), padx=5, pady=5)
+        
+        self.status_label = ttk.Label(progress_frame, text="Ready")
+        self.status_label.grid(row=1, column=0, sticky=(tk.W, tk.E), padx=5, pady=5)
+        
+        # Job queue
+        jobs_frame = ttk.LabelFrame(main_frame, text="Queue", padding="5")
+        jobs_frame.grid(row=6, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=5)
+        
+        self.jobs_tree = ttk.Treeview(jobs_frame, columns=('folder', 'priority', 'state'), show='headings', height=4)
+        self.jobs_tree.heading('folder', text="Folder")
+        self.jobs_tree.heading('priority', text="Priority")
+        self.jobs_tree.heading('state', text="State")
+        self.jobs_tree.column('folder', width=450)
+        self.jobs_tree.column('priority', width=60, anchor=tk.CENTER)
+        self.jobs_tree.column('state', width=80, anchor=tk.CENTER)
+        self.jobs_tree.grid(row=0, column=0, sticky=(tk.W, tk.E), padx=5)
+        jobs_frame.columnconfigure(0, weight=1)
+        
+        job_buttons = ttk.Frame(jobs_frame)
+        job_buttons.grid(row=1, column=0, sticky=tk.W, pady=5)
+        self.run_queue_button = ttk.Button(job_buttons, text="Run Queue", command=self.run_queue)
+        self.run_queue_button.pack(side=tk.LEFT, padx=5)
+        ttk.Button(job_buttons, text="Pause", command=lambda: self.change_job(self.job_queue.pause)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(job_buttons, text="Resume", command=lambda: self.change_job(self.job_queue.resume)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(job_buttons, text="Cancel", command=lambda: self.change_job(self.job_queue.cancel)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(job_buttons, text="Priority +", command=lambda: self.change_priority(1)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(job_buttons, text="Priority -", command=lambda: self.change_priority(-1)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(job_buttons, text="Clear Finished", command=self.clear_finished_jobs).pack(side=tk.LEFT, padx=5)
+        
+        # Last processed image frame
+        image_frame = ttk.LabelFrame(main_frame, text="Last Processed Image", padding="5")
+        image_frame.grid(row=7, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), pady=5)
+        
+        self.image_label = ttk.Label(image_frame)
+        self.image_label.grid(row=0, column=0, padx=5, pady=5)
+        
+        # Bird name label
+        self.bird_name_label = ttk.Label(image_frame, text="", font=('Arial', 12, 'bold'))
+        self.bird_name_label.grid(row=1, column=0, padx=5, pady=5)
+        
+        # Configure grid weights
+        main_frame.columnconfigure(1, weight=1)
+        main_frame.rowconfigure(7, weight=1)
+        
+        # Queue for thread communication
+        self.queue = Queue()
+        self.polling = False
+        # Keep a reference, Tk doesn't and the preview would disappear
+        self.preview_photo = None
+        
+        # Store the input directory path
+        self.input_dir = None
+        # Folders queued for classification, kept between sessions
+        self.job_queue = JobQueue()
+        self.refresh_jobs()
+        # Stage timings of the running classification
+        self.metrics = None
+    
+    def browse_folder(self):
+        folder = filedialog.askdirectory()
+        if folder:
+            # If folder name starts with "0000", use its parent folder
+            folder_path = Path(folder)
+            if folder_path.name.startswith("0000"):
+                folder = str(folder_path.parent)
+            
+            self.folder_path.set(folder)
+            # Enable both start and distribute buttons when folder is selected
+            self.start_button.state(['!disabled'])
+            self.distribute_button.state(['!disabled'])
+            self.add_job_button.state(['!disabled'])
+            self.review_button.state(['!disabled'])
+    
+    def start_polling(self):
+        """Start polling the queue, once."""
+        if not self.polling:
+            self.polling = True
+            self.update_gui()
+    
+    def update_gui(self):
+        """Update GUI elements from the queue"""
+        latest_image = None
+        try:
+            while True:
+                msg = self.queue.get_nowait()
+                if msg['type'] == 'progress':
+                    self.progress_var.set(msg['value'])
+                    self.status_label.config(text=msg['text'])
+                elif msg['type'] == 'image':
+                    # Only the newest preview is worth turning into a PhotoImage
+                    latest_image = msg
+                elif msg['type'] == 'jobs':
+                    self.refresh_jobs()
+                elif msg['type'] == 'error':
+                    messagebox.showerror("Error", msg['text'])
+                    self.start_button.state(['!disabled'])
+        except Empty:
+            pass
+        finally:
+            if latest_image:
+                # PhotoImage has to be created on the Tk thread
+                from PIL import ImageTk
+
+                self.preview_photo = ImageTk.PhotoImage(latest_image['image'])
+                self.image_label.configure(image=self.preview_photo)
+                self.bird_name_label.config(text=latest_image['text'])
+            self.root.after(100, self.update_gui)
+    
+    def show_preview(self, source, text):
+        """Decode a preview on the calling thread and hand it to the Tk thread."""
+        try:
+            with timed(self.metrics, 'preview'):
+                img = load_preview(source)
+        except Exception as e:
+            print(f"Error loading preview: {str(e)}")
+            return
+        self.queue.put({
+            'type': 'image',
+            'image': img,
+            'text': text
+        })
+    
+    def read_options(self):
+        """Return the classify_folder options set in the window, or None after showing an error."""
+        api_key = self.api_key_var.get().strip()
+        if not api_key:
+            messagebox.showerror("Error", "Please enter your Google API Key")
+            return None
+        save_api_key(api_key)
+        
+        try:
+            concurrency = max(1, int(self.concurrency_var.get()))
+            batch_size = max(1, int(self.batch_size_var.get()))
+        except (tk.TclError, ValueError):
+            messagebox.showerror("Error", "Concurrent requests and images per request must be numbers")
+            return None
+        
+        return {
+            'location': self.location_var.get(),
+            'concurrency': concurrency,
+            'adaptive': self.adaptive_var.get(),
+            'batch_size': batch_size,
+            'bursts': self.bursts_var.get(),
+            'crop': self.crop_var.get(),
+            'placement': self.placement_var.get(),
+            'direct': self.direct_var.get(),
+            'xmp': self.xmp_var.get()
+        }
+    
+    def start_classification(self):
+        options = self.read_options()
+        if options is None:
+            return
+        
+        folder = self.folder_path.get()
+        if not folder:
+            messagebox.showerror("Error", "Please select an input folder")
+            return
+        
+        self.start_button.state(['disabled'])
+        self.progress_var.set(0)
+        self.status_label.config(text="Starting classification...")
+        
+        # Start processing in a separate thread
+        thread = threading.Thread(target=self.process_photos, args=(folder, self.api_key_var.get().strip()), kwargs=options)
+        thread.daemon = True
+        thread.start()
+        
+        # Start GUI updates
+        self.start_polling()
+    
+    def refresh_jobs(self):
+        """Show the jobs in the queue, keeping the selection."""
+        selection = self.jobs_tree.selection()
+        self.jobs_tree.delete(*self.jobs_tree.get_children())
+        for job in self.job_queue.jobs():
+            self.jobs_tree.insert('', tk.END, iid=str(job.id), values=(job.folder, job.priority, job.state))
+        self.jobs_tree.selection_set([iid for iid in selection if self.jobs_tree.exists(iid)])
+    
+    def selected_jobs(self):
+        return [int(iid) for iid in self.jobs_tree.selection()]
+    
+    def add_job(self):
+        options = self.read_options()
+        if options is None:
+            return
+        folder = self.folder_path.get()
+        if not folder:
+            messagebox.showerror("Error", "Please select an input folder")
+            return
+        self.job_queue.add(folder, options=options)
+        self.refresh_jobs()
+    
+    def change_job(self, action):
+        """Apply a JobQueue action like pause or cancel to the selected jobs."""
+        for job_id in self.selected_jobs():
+            action(job_id)
+        self.refresh_jobs()
+    
+    def clear_finished_jobs(self):
+        self.job_queue.remove_finished()
+        self.refresh_jobs()
+    
+    def change_priority(self, delta):
+        for job_id in self.selected_jobs():
+            job = self.job_queue.get(job_id)
+            if job:
+                self.job_queue.set_priority(job_id, job.priority + delta)
+        self.refresh_jobs()
+    
+    def run_queue(self):
+        api_key = self.api_key_var.get().strip()
+        if not api_key:
+            messagebox.showerror("Error", "Please enter your Google API Key")
+            return
+        save_api_key(api_key)
+        
+        self.run_queue_button.state(['disabled'])
+        self.start_button.state(['disabled'])
+        self.progress_var.set(0)
+        self.status_label.config(text="Starting the queue...")
+        
+        thread = threading.Thread(target=self._run_queue_thread, args=(api_key,))
+        thread.daemon = True
+        thread.start()
+        
+        self.start_polling()
+    
+    def _run_queue_thread(self, api_key):
+        """Thread function running the queued jobs one after another."""
+        runner = JobRunner(self.job_queue, api_key)
+        self.metrics = None
+        
+        def messages():
+            current = None
+            for job, msg in runner.run():
+                if job.id != current:
+                    current = job.id
+                    self.input_dir = Path(job.folder)
+                    self.queue.put({'type': 'jobs'})
+                if msg['type'] == 'done':
+                    msg = dict(msg, text=f"{job.folder}: {msg['text']}")
+                yield msg
+        
+        try:
+            self.show_classification(messages(), notify=False)
+        finally:
+            runner.close()
+            self.queue.put({'type': 'jobs'})
+            self.run_queue_button.state(['!disabled'])
+        messagebox.showinfo("Queue", "The queue is done.")
+    
+    def review_results(self):
+        folder = self.folder_path.get()
+        if not folder:
+            messagebox.showerror("Error", "Please select an input folder")
+            return
+        ReviewGallery(self.root, Path(folder))
+    
+    def distribute_photos(self):
+        self.input_dir = Path(self.folder_path.get())
+        """Distribute photos into folders based on their names."""
+        if not self.input_dir:
+            messagebox.showerror("Error", "Please select an input folder first")
+            return
+            
+        # Reset progress bar
+        self.progress_var.set(0)
+        self.status_label.config(text="Starting distribution...")
+        
+        # Disable the distribute button while processing
+        self.distribute_button.state(['disabled'])
+        
+        # Start processing in a separate thread
+        thread = threading.Thread(target=self._distribute_photos_thread)
+        thread.daemon = True
+        thread.start()
+        
+        # Start GUI updates
+        self.start_polling()
+    
+    def _distribute_photos_thread(self):
+        """Thread function for distributing photos."""
+        try:
+            # Get API key for bird info
+            api_key = self.api_key_var.get().strip()
+            
+            for msg in distribute_folder(self.input_dir, api_key):
+                if msg['type'] == 'done':
+                    # Update final status with summary
+                    self.queue.put({
+                        'type': 'progress',
+                        'value': 100,
+                        'text': msg['text']
+                    })
+                    messagebox.showinfo("Success", f"Photos have been distributed into folders!\nOrganized {len(msg['species'])} unique bird species.")
+                else:
+                    self.queue.put(msg)
+            
+        except Exception as e:
+            self.queue.put({
+                'type': 'error',
+                'text': f"Error during distribution: {str(e)}"
+            })
+            messagebox.showerror("Error", f"Error during distribution: {str(e)}")
+        finally:
+            # Re-enable the distribute button
+            self.distribute_button.state(['!disabled'])
+
+    def process_photos(self, input_folder, api_key, **options):
+        """Process photos from the input folder. options are passed on to classify_folder."""
+        # Store input directory for later use
+        self.input_dir = Path(input_folder)
+        self.metrics = Metrics()
+        self.show_classification(classify_folder(self.input_dir, api_key, previews=True, metrics=self.metrics, **options))
+    
+    def show_classification(self, messages, notify=True):
+        """Show classify_folder messages, run on a worker thread.
+
+        Unless notify is False, the end of the run is announced in a dialog.
+        """
+        # Photos tagged in XMP sidecars stay where they are, there is nothing to distribute
+        tagged = False
+        try:
+            # Previews are throttled, the latest one waits until it is due
+            pending_preview = None
+            last_preview = 0
+            for msg in messages:
+                if msg['type'] == 'result':
+                    self.queue.put({
+                        'type': 'progress',
+                        'value': msg['value'],
+                        'text': msg['text']
+                    })
+                    
+                    if msg['status'] == 'failed':
+                        status_text = "Failed to identify, will retry on the next run"
+                    else:
+                        status_text = f"Bird: {msg['bird_name']}"
+                    if msg.get('is_blurred'):
+                        status_text += " (Blurred)"
+                    if msg['location']:
+                        status_text += f" ({msg['location']})"
+                    
+                    # Update last processed image, reusing the downscaled upload if there is one
+                    pending_preview = (msg.get('preview') or msg['image'], status_text)
+                    if time.monotonic() - last_preview >= 1 / PREVIEW_FPS:
+                        self.show_preview(*pending_preview)
+                        pending_preview = None
+                        last_preview = time.monotonic()
+                elif msg['type'] == 'done':
+                    if pending_preview:
+                        self.show_preview(*pending_preview)
+
+                    # Update final status
+                    self.queue.put({
+                        'type': 'progress',
+                        'value': 100,
+                        'text': msg['text']
+                    })
+                    
+                    tagged = msg.get('sidecars') is not None
+                    
+                    if notify:
+                        if msg['failed']:
+                            messagebox.showwarning("Warning", msg['text'])
+                        else:
+                            messagebox.showinfo("Success", msg['text'])
+                else:
+                    self.queue.put(msg)
+            
+        except Exception as e:
+            self.queue.put({
+                'type': 'error',
+                'text': f"Error: {str(e)}"
+            })
+            print(f"Error during classification: {str(e)}")
+            #messagebox.showerror("Error", f"Error during classification: {str(e)}")
+        finally:
+            self.start_button.state(['!disabled'])
+            self.distribute_button.state(['disabled' if tagged else '!disabled'])
+
+def run_gui():
+    root = tk.Tk()
+    app = BirdClassifierGUI(root)
+    benchmark_path = os.environ.get(STARTUP_BENCHMARK_ENV)
+    if benchmark_path:
+        root.after(0, lambda: report_first_window(root, benchmark_path))
+    root.mainloop()
+
+def report_first_window(root, path):
+    """Write the time once the window is on screen and close it."""
+    root.wait_visibility()
+    root.update_idletasks()
+    with open(path, 'w') as f:
+        f.write(str(time.time()))
+    root.destroy()
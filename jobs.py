@@ -0,0 +1,231 @@
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from cache import APP_DIR
+from store import SQLiteStore
+from classifier import classify_folder
+from engine import WorkerPools
+
+DEFAULT_JOBS_PATH = APP_DIR / 'jobs.sqlite3'
+
+# Job states. A paused or cancelled job that was running stops after the
+# image it is on, the manifest of its folder lets it resume later.
+QUEUED = 'queued'
+RUNNING = 'running'
+PAUSED = 'paused'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+Job = namedtuple('Job', ['id', 'folder', 'priority', 'state', 'options', 'added', 'summary'])
+
+def process_alive(pid):
+    """Whether a process with this id is running on this machine."""
+    if sys.platform.startswith('win'):
+        # os.kill would terminate it on Windows
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        code = ctypes.c_ulong()
+        try:
+            return bool(kernel32.GetExitCodeProcess(handle, ctypes.byref(code))) and code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Someone else's
+        return True
+    return True
+
+class JobQueue(SQLiteStore):
+    """Persistent queue of folders to classify.
+
+    Jobs are run highest priority first, then in the order they were added.
+    options are keyword arguments for classify_folder and must be JSON
+    serializable. The queue lives in SQLite, so jobs survive restarts and
+    can be paused or cancelled from another process while they run. A
+    running job records the process running it, so runners in several
+    processes can share the queue.
+    """
+
+    def __init__(self, path=DEFAULT_JOBS_PATH):
+        super().__init__(path, ["""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                folder TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                options TEXT NOT NULL,
+                added REAL NOT NULL,
+                summary TEXT
+            )
+        """])
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")]
+        if 'owner' not in columns:
+            # Queues from before jobs recorded their runner
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN owner INTEGER")
+        self.conn.commit()
+
+    def _job(self, row):
+        return Job(row[0], row[1], row[2], row[3], json.loads(row[4]), row[5],
+                   json.loads(row[6]) if row[6] else None)
+
+    def add(self, folder, priority=0, options=None):
+        """Queue a folder and return the id of its job."""
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO jobs (folder, priority, state, options, added) VALUES (?, ?, ?, ?, ?)",
+                (str(Path(folder).resolve()), priority, QUEUED, json.dumps(options or {}), time.time())
+            )
+            self.conn.commit()
+            return cursor.lastrowid
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def jobs(self):
+        """Every job, in the order they will run."""
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM jobs ORDER BY priority DESC, id").fetchall()
+        return [self._job(row) for row in rows]
+
+    def next_job(self):
+        """Mark the next queued job as running by this process and return it, or None if nothing is queued."""
+        with self.lock:
+            while True:
+                row = self.conn.execute(
+                    "SELECT * FROM jobs WHERE state = ? ORDER BY priority DESC, id LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is None:
+                    return None
+                # Only if no runner in another process took it meanwhile
+                cursor = self.conn.execute("UPDATE jobs SET state = ?, owner = ? WHERE id = ? AND state = ?",
+                                           (RUNNING, os.getpid(), row[0], QUEUED))
+                self.conn.commit()
+                if cursor.rowcount:
+                    return self._job(row)._replace(state=RUNNING)
+
+    def _set_state(self, job_id, state, from_states, summary=None):
+        """Move a job to state if it is in one of from_states, return whether it was."""
+        with self.lock:
+            cursor = self.conn.execute(
+                f"UPDATE jobs SET state = ?, summary = COALESCE(?, summary) "
+                f"WHERE id = ? AND state IN ({', '.join('?' * len(from_states))})",
+                (state, json.dumps(summary) if summary is not None else None, job_id, *from_states)
+            )
+            self.conn.commit()
+            return cursor.rowcount > 0
+
+    def finish(self, job_id, state, summary=None):
+        """Record how a running job ended, unless it was paused or cancelled meanwhile."""
+        return self._set_state(job_id, state, [RUNNING], summary)
+
+    def pause(self, job_id):
+        return self._set_state(job_id, PAUSED, [QUEUED, RUNNING])
+
+    def resume(self, job_id):
+        """Queue a paused, failed or cancelled job again."""
+        return self._set_state(job_id, QUEUED, [PAUSED, FAILED, CANCELLED])
+
+    def cancel(self, job_id):
+        return self._set_state(job_id, CANCELLED, [QUEUED, RUNNING, PAUSED])
+
+    def set_priority(self, job_id, priority):
+        with self.lock:
+            self.conn.execute("UPDATE jobs SET priority = ? WHERE id = ?", (priority, job_id))
+            self.conn.commit()
+
+    def requeue(self, job_id):
+        """Queue a running job again, e.g. when the runner is stopped."""
+        return self._set_state(job_id, QUEUED, [RUNNING])
+
+    def recover(self):
+        """Queue jobs left running by a process that is gone, e.g. after a crash.
+
+        Jobs whose process is still running are left to it.
+        """
+        with self.lock:
+            rows = self.conn.execute("SELECT id, owner FROM jobs WHERE state = ?", (RUNNING,)).fetchall()
+            for job_id, owner in rows:
+                if owner is None or not process_alive(owner):
+                    self.conn.execute("UPDATE jobs SET state = ? WHERE id = ? AND state = ?",
+                                      (QUEUED, job_id, RUNNING))
+            self.conn.commit()
+
+    def remove_finished(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM jobs WHERE state IN (?, ?)", (DONE, CANCELLED))
+            self.conn.commit()
+
+class JobRunner:
+    """Run the jobs of a JobQueue one after another on one set of WorkerPools.
+
+    run() is a generator of (job, message) pairs, with the classify_folder
+    messages of each job. Between images it checks whether the job was
+    paused or cancelled, and stops it if so. Runners in other processes can
+    work on the same queue, a runner only takes over jobs left running by a
+    process that is gone.
+    """
+
+    def __init__(self, queue, api_key, pools=None):
+        self.queue = queue
+        self.api_key = api_key
+        self.own_pools = pools is None
+        self.pools = pools or WorkerPools()
+        self.stopped = False
+
+    def stop(self):
+        """Stop after the current image, leaving the current job to be resumed."""
+        self.stopped = True
+
+    def run(self):
+        self.queue.recover()
+        while not self.stopped:
+            job = self.queue.next_job()
+            if job is None:
+                return
+            yield from self._run_job(job)
+
+    def _run_job(self, job):
+        messages = classify_folder(job.folder, self.api_key, pools=self.pools, **job.options)
+        summary = None
+        state = DONE
+        try:
+            for msg in messages:
+                yield job, msg
+                if msg['type'] == 'error':
+                    state = FAILED
+                    summary = {'error': msg['text']}
+                elif msg['type'] == 'done':
+                    summary = {k: v for k, v in msg.items() if k not in ['type', 'value', 'text']}
+                    if msg['failed']:
+                        state = FAILED
+                elif self.stopped or self.queue.get(job.id).state != RUNNING:
+                    # Paused or cancelled, the manifest keeps what is done
+                    return
+        except Exception as e:
+            state = FAILED
+            summary = {'error': str(e)}
+            yield job, {'type': 'error', 'text': f"Error classifying {job.folder}: {str(e)}"}
+        finally:
+            messages.close()
+            if summary is None:
+                # Stopped before the end, queue it again unless it was paused or cancelled
+                self.queue.requeue(job.id)
+            else:
+                self.queue.finish(job.id, state, summary)
+
+    def close(self):
+        if self.own_pools:
+            self.pools.close()
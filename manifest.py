@@ -0,0 +1,108 @@
+import json
+import os
+from pathlib import Path
+
+MANIFEST_NAME = '.classification_job.jsonl'
+
+# Image states, in the order an image moves through them. Images that are
+# not in the manifest yet are pending.
+PENDING = 'pending'
+CLASSIFIED = 'classified'
+COPIED = 'copied'
+
+class JobManifest:
+    """Checkpoint of a classification run, so an interrupted run can resume.
+
+    Images are identified by their path relative to the input folder.
+
+    The manifest is an append-only JSON lines file. Every state change is a
+    single line written and fsynced on its own, so a crash can at worst lose
+    the line being written, which is ignored when the manifest is read back.
+    On load the log is compacted into a snapshot through a temporary file and
+    os.replace, so the file on disk is always either the old or the new one.
+    """
+
+    def __init__(self, output_dir):
+        self.path = Path(output_dir) / MANIFEST_NAME
+        self.images = {}
+        self.loaded_birds = ["None"]
+        if self.path.exists():
+            self._load()
+            self._compact()
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def _load(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn write from a crash, everything after it is lost anyway
+                    break
+                self._apply(entry)
+
+    def _apply(self, entry):
+        if entry.get('type') == 'snapshot':
+            self.images = entry['images']
+            self.loaded_birds = entry['loaded_birds']
+            return
+        record = self.images.setdefault(entry['image'], {})
+        record.update(entry)
+        del record['image']
+        if entry['state'] == COPIED:
+            self.loaded_birds.append(entry['loaded_bird'])
+
+    def _compact(self):
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({
+                'type': 'snapshot',
+                'images': self.images,
+                'loaded_birds': self.loaded_birds
+            }) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _append(self, entry):
+        self._apply(entry)
+        self.file.write(json.dumps(entry) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def state(self, image):
+        return self.images.get(image, {}).get('state', PENDING)
+
+    def result(self, image):
+        """Return the recorded (contains_bird, bird_name, is_blurred), or None if not classified yet."""
+        record = self.images.get(image)
+        if not record or record['state'] == PENDING:
+            return None
+        return record['contains_bird'], record['bird_name'], record['is_blurred']
+
+    def mark_classified(self, image, result):
+        contains_bird, bird_name, is_blurred = result
+        self._append({
+            'image': image,
+            'state': CLASSIFIED,
+            'contains_bird': contains_bird,
+            'bird_name': bird_name,
+            'is_blurred': is_blurred
+        })
+
+    def mark_copied(self, image, output_name, loaded_bird):
+        """Record that the image was copied, and the bird it added to the loaded birds context."""
+        self._append({
+            'image': image,
+            'state': COPIED,
+            'output': output_name,
+            'loaded_bird': loaded_bird
+        })
+
+    def close(self):
+        self.file.close()
+
+    def remove(self):
+        """Delete the manifest once the job has completed."""
+        self.close()
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,103 @@
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+from cache import APP_DIR
+
+DEFAULT_METRICS_DIR = APP_DIR / 'metrics'
+PROMETHEUS_PREFIX = 'bird_classifier'
+
+# The stages of classifying a photo, in the order they happen
+STAGES = ['scan', 'read', 'exif', 'encode', 'network', 'parse', 'copy', 'preview']
+
+class Metrics:
+    """Per-stage timers and counters of a classification run.
+
+    Stage times are summed over all the work done in a stage, so stages that
+    run in parallel (encoding on the process pool, network on the worker
+    threads) can add up to more than the wall-clock time of the run. Stages
+    are timed from several threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.stage_seconds = {stage: 0.0 for stage in STAGES}
+        self.stage_calls = {stage: 0 for stage in STAGES}
+        self.counters = {}
+
+    def add_time(self, stage, seconds, calls=1):
+        with self.lock:
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+            self.stage_calls[stage] = self.stage_calls.get(stage, 0) + calls
+
+    @contextmanager
+    def time(self, stage):
+        """Time the body of a with statement as one call of stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self):
+        """Return the metrics as a JSON serializable dict."""
+        with self.lock:
+            return {
+                'started': self.started,
+                'elapsed_seconds': round(time.time() - self.started, 3),
+                'stages': {
+                    stage: {'seconds': round(self.stage_seconds[stage], 3), 'calls': self.stage_calls[stage]}
+                    for stage in self.stage_seconds
+                },
+                'counters': dict(self.counters)
+            }
+
+    def to_prometheus(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = [
+            f"# HELP {PROMETHEUS_PREFIX}_stage_seconds_total Time spent in each stage of classification.",
+            f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds_total counter"
+        ]
+        for stage, values in snapshot['stages'].items():
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_total{{stage="{stage}"}} {values["seconds"]}')
+        lines.append(f"# HELP {PROMETHEUS_PREFIX}_stage_calls_total Number of times each stage ran.")
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_stage_calls_total counter")
+        for stage, values in snapshot['stages'].items():
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_calls_total{{stage="{stage}"}} {values["calls"]}')
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name}_total counter")
+            lines.append(f"{PROMETHEUS_PREFIX}_{name}_total {value}")
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_elapsed_seconds gauge")
+        lines.append(f"{PROMETHEUS_PREFIX}_elapsed_seconds {snapshot['elapsed_seconds']}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, metrics_dir=DEFAULT_METRICS_DIR, name='run'):
+        """Write the metrics to <time>-<name>.json and .prom in metrics_dir and return the paths."""
+        metrics_dir = Path(metrics_dir)
+        metrics_dir.mkdir(parents=True, exist_ok=True)
+        stem = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started))}-{name}"
+        json_path = metrics_dir / f"{stem}.json"
+        prom_path = metrics_dir / f"{stem}.prom"
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        with open(prom_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        return json_path, prom_path
+
+def timed(metrics, stage):
+    """metrics.time(stage), or a no-op without metrics."""
+    return metrics.time(stage) if metrics else nullcontext()
+
+def format_eta(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
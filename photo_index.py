@@ -0,0 +1,102 @@
+import os
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from cache import APP_DIR
+from species_info import species_key
+from store import SQLiteStore
+
+DEFAULT_INDEX_PATH = APP_DIR / 'photo_index.sqlite3'
+
+IndexedPhoto = namedtuple('IndexedPhoto', ['original', 'content_hash', 'species', 'is_blurred',
+                                           'timestamp', 'folder', 'output'])
+
+class PhotoIndex(SQLiteStore):
+    """SQLite index of every classified photo, across all folders ever classified.
+
+    There is one row per original file, RAW sidecars included, with the
+    content hash of the image that was classified for it, its species and
+    where its output copy is: folder is the 0000-bird-folders folder and
+    output the path inside it. Photos tagged in place with XMP sidecars have
+    no copy, their output is the original relative to folder. Distribution
+    plans its moves from the index instead of parsing file names, and the
+    species queries don't touch the photos at all.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        super().__init__(path, [
+            """
+            CREATE TABLE IF NOT EXISTS photos (
+                original TEXT PRIMARY KEY,
+                content_hash TEXT,
+                species TEXT,
+                species_key TEXT,
+                is_blurred INTEGER NOT NULL,
+                timestamp REAL,
+                folder TEXT NOT NULL,
+                output TEXT NOT NULL,
+                indexed REAL NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS photos_species ON photos (species_key)",
+            "CREATE INDEX IF NOT EXISTS photos_folder ON photos (folder)"
+        ])
+
+    def record(self, original, content_hash, species, is_blurred, timestamp, folder, output):
+        """Add or replace the row of an original file."""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO photos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (str(Path(original).resolve()), content_hash, species, species_key(species) if species else None,
+                 int(is_blurred), timestamp, str(Path(folder).resolve()), output, time.time())
+            )
+            self.conn.commit()
+
+    def _photos(self, where, params):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT original, content_hash, species, is_blurred, timestamp, folder, output FROM photos "
+                f"WHERE {where} ORDER BY folder, output", params
+            ).fetchall()
+        return [IndexedPhoto(row[0], row[1], row[2], bool(row[3]), row[4], row[5], row[6]) for row in rows]
+
+    def photo(self, original):
+        """The row of an original file, or None if it was never classified."""
+        photos = self._photos("original = ?", (str(Path(original).resolve()),))
+        return photos[0] if photos else None
+
+    def folder_photos(self, folder):
+        """Every photo whose output is in the given 0000-bird-folders folder."""
+        return self._photos("folder = ?", (str(Path(folder).resolve()),))
+
+    def photos_of(self, bird_name):
+        """Every photo of a species, in any folder."""
+        return self._photos("species_key = ?", (species_key(bird_name),))
+
+    def originals_under(self, directory):
+        """Return the set of indexed originals in directory and its subfolders."""
+        prefix = os.path.join(str(Path(directory).resolve()), '')
+        with self.lock:
+            # Everything starting with prefix, i.e. sorting before the separator's successor
+            rows = self.conn.execute(
+                "SELECT original FROM photos WHERE original >= ? AND original < ?",
+                (prefix, prefix[:-1] + chr(ord(os.sep) + 1))
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def species_counts(self):
+        """Return (species, number of photos) pairs, most photographed first."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT MIN(species), COUNT(*) FROM photos WHERE species_key IS NOT NULL "
+                "GROUP BY species_key ORDER BY COUNT(*) DESC, MIN(species)"
+            ).fetchall()
+        return rows
+
+    def move_outputs(self, moves):
+        """Record new output paths for (original, output) pairs, all in one transaction."""
+        with self.lock:
+            self.conn.executemany("UPDATE photos SET output = ? WHERE original = ?",
+                                  [(output, original) for original, output in moves])
+            self.conn.commit()
@@ -0,0 +1,64 @@
+import errno
+import os
+import shutil
+import sys
+
+COPY = 'copy'
+HARDLINK = 'hardlink'
+REFLINK = 'reflink'
+MOVE = 'move'
+STRATEGIES = [COPY, HARDLINK, REFLINK, MOVE]
+
+# Linux FICLONE ioctl, shares the data blocks of a file on btrfs, XFS and friends
+FICLONE = 0x40049409
+
+def _reflink(src, dst):
+    """Create dst as a copy-on-write clone of src, raising OSError where unsupported."""
+    if sys.platform == 'darwin':
+        import ctypes
+        libc = ctypes.CDLL('libc.dylib', use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+    elif sys.platform.startswith('linux'):
+        import fcntl
+        with open(src, 'rb') as s, open(dst, 'wb') as d:
+            try:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            except OSError:
+                d.close()
+                os.unlink(dst)
+                raise
+    else:
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are not supported on this platform")
+    shutil.copystat(src, dst)
+
+def place_file(src, dst, strategy=COPY):
+    """Put src at dst using the given strategy and return the strategy that was used.
+
+    hardlink and reflink don't copy any data and fall back to a copy when
+    the filesystem can't do them, e.g. when src and dst are on different
+    filesystems. move renames src, which also becomes a copy and delete
+    across filesystems.
+    """
+    src, dst = str(src), str(dst)
+    # Replace the result of an earlier run, which may be a link to src itself
+    if os.path.lexists(dst):
+        os.unlink(dst)
+    if strategy == HARDLINK:
+        try:
+            os.link(src, dst)
+            return HARDLINK
+        except OSError:
+            pass
+    elif strategy == REFLINK:
+        try:
+            _reflink(src, dst)
+            return REFLINK
+        except OSError:
+            pass
+    elif strategy == MOVE:
+        shutil.move(src, dst)
+        return MOVE
+    shutil.copy2(src, dst)
+    return COPY
@@ -0,0 +1,259 @@
+import hashlib
+import io
+import os
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+# Long edge in pixels the model gets to see, and the JPEG quality it is sent at
+DEFAULT_MAX_EDGE = 1600
+DEFAULT_QUALITY = 85
+
+MIME_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+}
+
+# Size the burst features (perceptual hash and sharpness) are computed at
+FEATURE_EDGE = 512
+
+# Sharpness is measured per tile, see get_sharpness
+SHARPNESS_GRID = 8
+SHARPEST_TILES = 3
+# Images scoring below this are marked blurred
+DEFAULT_BLUR_THRESHOLD = 100.0
+# Images scoring below this are too blurred to be worth identifying
+DEFAULT_HOPELESS_THRESHOLD = 15.0
+
+# Crops around a bird get this fraction of the box size added on every side,
+# and are at least CROP_MIN_EDGE pixels, so the model still sees some context
+CROP_MARGIN = 0.3
+CROP_MIN_EDGE = 384
+# Crops bigger than this fraction of the frame both ways aren't worth it, the downscaled frame is sent instead
+CROP_MAX_FRACTION = 0.6
+
+PreparedImage = namedtuple('PreparedImage', [
+    'data', 'mime_type', 'original_bytes', 'encoded_bytes', 'content_hash',
+    'dhash', 'sharpness', 'timestamp', 'position', 'timings'
+])
+
+def get_mime_type(image_path):
+    """Return the mime type for an image file based on its extension."""
+    return MIME_TYPES.get(os.path.splitext(str(image_path))[1].lower(), 'image/jpeg')
+
+def get_capture_time(img, image_path):
+    """Return the capture time of an image as a unix timestamp.
+
+    Uses DateTimeOriginal (with sub-seconds) from EXIF, falling back to the
+    file modification time.
+    """
+    try:
+        exif = img.getexif().get_ifd(0x8769)
+        taken = exif.get(36867)
+        if taken:
+            timestamp = datetime.strptime(taken.strip('\x00 '), '%Y:%m:%d %H:%M:%S').timestamp()
+            subsec = str(exif.get(37521) or '').strip('\x00 ')
+            if subsec.isdigit():
+                timestamp += int(subsec) / 10 ** len(subsec)
+            return timestamp
+    except (ValueError, TypeError, AttributeError):
+        pass
+    return os.path.getmtime(image_path)
+
+def get_gps_position(img):
+    """Return the (latitude, longitude) in decimal degrees from the EXIF GPS tags, or None."""
+    try:
+        gps = img.getexif().get_ifd(0x8825)
+        lat, lon = gps.get(2), gps.get(4)
+        if not lat or not lon:
+            return None
+        lat = float(lat[0]) + float(lat[1]) / 60 + float(lat[2]) / 3600
+        lon = float(lon[0]) + float(lon[1]) / 60 + float(lon[2]) / 3600
+        if str(gps.get(1, 'N')).strip('\x00 ').upper() == 'S':
+            lat = -lat
+        if str(gps.get(3, 'E')).strip('\x00 ').upper() == 'W':
+            lon = -lon
+    except (ValueError, TypeError, AttributeError, IndexError, ZeroDivisionError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or (lat == 0 and lon == 0):
+        # Garbage, or a camera that writes zeros without a fix
+        return None
+    return lat, lon
+
+def get_dhash(img):
+    """64 bit difference hash of an image, near-duplicates differ in only a few bits."""
+    from PIL import Image
+
+    small = img.convert('L').resize((9, 8), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+def get_sharpness(img):
+    """Sharpness score of an image, higher is sharper.
+
+    The variance of the Laplacian of the luminance plane at FEATURE_EDGE is
+    computed for each tile of a SHARPNESS_GRID x SHARPNESS_GRID grid, and the
+    score is the mean of the SHARPEST_TILES sharpest tiles. A sharp bird
+    against a smooth, out of focus background still scores high.
+    """
+    import numpy as np
+
+    gray = img.convert('L')
+    gray.thumbnail((FEATURE_EDGE, FEATURE_EDGE))
+    y = np.asarray(gray, dtype=np.float32)
+    laplacian = y[:-2, 1:-1] + y[2:, 1:-1] + y[1:-1, :-2] + y[1:-1, 2:] - 4 * y[1:-1, 1:-1]
+    height, width = laplacian.shape
+    tile_height, tile_width = height // SHARPNESS_GRID, width // SHARPNESS_GRID
+    if tile_height < 2 or tile_width < 2:
+        return float(laplacian.var()) if laplacian.size else 0.0
+    tiles = laplacian[:tile_height * SHARPNESS_GRID, :tile_width * SHARPNESS_GRID]
+    tiles = tiles.reshape(SHARPNESS_GRID, tile_height, SHARPNESS_GRID, tile_width).swapaxes(1, 2)
+    variances = np.sort(tiles.reshape(SHARPNESS_GRID * SHARPNESS_GRID, -1).var(axis=1))
+    return float(variances[-SHARPEST_TILES:].mean())
+
+def looks_blurred(image, threshold=DEFAULT_BLUR_THRESHOLD):
+    """Whether a prepared image's sharpness is below the blur threshold."""
+    return image.sharpness < threshold
+
+def prepare_image(image_path, max_edge=DEFAULT_MAX_EDGE, quality=DEFAULT_QUALITY):
+    """Downscale and re-encode an image for upload.
+
+    JPEGs are decoded in draft mode so the decoder only produces roughly the
+    requested size instead of the full sensor resolution. If max_edge is falsy,
+    or re-encoding would not make the payload smaller, the original bytes are
+    sent as they are. The capture time, perceptual hash and sharpness used to
+    group bursts are computed from the same decode, and so is the GPS position.
+    timings holds the seconds spent reading, parsing EXIF and encoding.
+    """
+    # Pillow and numpy are imported on first use, they only slow the window down
+    from PIL import Image, ImageOps
+
+    start = time.perf_counter()
+    with open(image_path, 'rb') as f:
+        original = f.read()
+    original_bytes = len(original)
+    # Hash of the original file, so copies and renames of it are recognized
+    content_hash = hashlib.sha256(original).hexdigest()
+    mime_type = get_mime_type(image_path)
+
+    read_done = time.perf_counter()
+
+    with Image.open(io.BytesIO(original)) as img:
+        timestamp = get_capture_time(img, image_path)
+        position = get_gps_position(img)
+        exif_done = time.perf_counter()
+        # Let the JPEG decoder scale down by 1/2, 1/4 or 1/8 while decoding
+        edge = max_edge or FEATURE_EDGE
+        img.draft('RGB', (edge, edge))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((edge, edge), Image.LANCZOS)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        dhash = get_dhash(img)
+        sharpness = get_sharpness(img)
+        if max_edge:
+            buffer = io.BytesIO()
+            img.save(buffer, format='JPEG', quality=quality)
+    timings = {'read': read_done - start, 'exif': exif_done - read_done, 'encode': time.perf_counter() - exif_done}
+
+    if not max_edge or len(buffer.getvalue()) >= original_bytes:
+        return PreparedImage(original, mime_type, original_bytes, original_bytes, content_hash,
+                             dhash, sharpness, timestamp, position, timings)
+    data = buffer.getvalue()
+    return PreparedImage(data, 'image/jpeg', original_bytes, len(data), content_hash,
+                         dhash, sharpness, timestamp, position, timings)
+
+def shrink_image(data, edge, quality=DEFAULT_QUALITY):
+    """Downscale encoded image bytes to at most edge pixels on the long edge and return them as JPEG."""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft('RGB', (edge, edge))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((edge, edge), Image.LANCZOS)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+def crop_image(image_path, box, max_edge=DEFAULT_MAX_EDGE, quality=DEFAULT_QUALITY, margin=CROP_MARGIN):
+    """Return a JPEG of the region around box at full resolution, or None if the region is most of the frame.
+
+    box is (top, left, bottom, right) as fractions of the upright image.
+    The crop is downscaled to max_edge only if it is bigger than that, so a
+    small bird keeps every pixel the sensor recorded of it.
+    """
+    from PIL import Image, ImageOps
+
+    top, left, bottom, right = box
+    with Image.open(image_path) as img:
+        img = ImageOps.exif_transpose(img)
+        width, height = img.size
+        crop_width = max((right - left) * width * (1 + 2 * margin), min(CROP_MIN_EDGE, width))
+        crop_height = max((bottom - top) * height * (1 + 2 * margin), min(CROP_MIN_EDGE, height))
+        if crop_width >= width * CROP_MAX_FRACTION and crop_height >= height * CROP_MAX_FRACTION:
+            return None
+        crop_width, crop_height = min(crop_width, width), min(crop_height, height)
+        # Centered on the box, shifted back inside the frame at the edges
+        x = min(max((left + right) / 2 * width - crop_width / 2, 0), width - crop_width)
+        y = min(max((top + bottom) / 2 * height - crop_height / 2, 0), height - crop_height)
+        img = img.crop((int(x), int(y), int(x + crop_width), int(y + crop_height)))
+        if max_edge:
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+class ImagePreprocessor:
+    """Prepare images on a process pool so decoding runs ahead of the network workers.
+
+    The pool is its own unless a shared executor is passed in, which is then
+    left running on close.
+    """
+
+    def __init__(self, max_edge=DEFAULT_MAX_EDGE, quality=DEFAULT_QUALITY, workers=None, executor=None):
+        self.max_edge = max_edge
+        self.quality = quality
+        self.own_executor = executor is None
+        self.executor = executor or ProcessPoolExecutor(max_workers=workers)
+
+    def submit(self, image_path):
+        return self.executor.submit(prepare_image, str(image_path), self.max_edge, self.quality)
+
+    def prepare_ahead(self, image_paths, lookahead):
+        """Yield (image_path, future) pairs, keeping `lookahead` images in preparation."""
+        image_paths = iter(image_paths)
+        pending = deque()
+        for image_path in image_paths:
+            pending.append((image_path, self.submit(image_path)))
+            if len(pending) >= lookahead:
+                break
+        try:
+            while pending:
+                yield pending.popleft()
+                for image_path in image_paths:
+                    pending.append((image_path, self.submit(image_path)))
+                    break
+        finally:
+            # Stopped early, don't prepare images nobody will use
+            for _, future in pending:
+                future.cancel()
+
+    def close(self):
+        if self.own_executor:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+from queue import Queue
+
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png']
+RAW_EXTENSIONS = ['.cr2', '.cr3', '.nef', '.nrw', '.arw', '.srf', '.sr2', '.raf', '.orf',
+                  '.rw2', '.pef', '.srw', '.dng', '.3fr', '.iiq', '.x3f']
+
+ScanItem = namedtuple('ScanItem', ['path', 'sidecars'])
+
+def is_skipped_dir(name):
+    # Our own output folders, and hidden folders
+    return name.startswith('0000') or name.startswith('.')
+
+def scan_images(root):
+    """Walk root recursively and yield a ScanItem per image, as they are found.
+
+    Each directory is listed once with os.scandir and its files are yielded
+    in sorted order before descending into its sorted subdirectories, so the
+    order is stable between runs. RAW files with the same stem as an image
+    in the same directory come along as its sidecars. RAW files without an
+    image to classify are not yielded.
+    """
+    try:
+        entries = sorted(os.scandir(root), key=lambda entry: entry.name)
+    except OSError:
+        return
+    files = []
+    subdirs = []
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if not is_skipped_dir(entry.name):
+                    subdirs.append(entry.path)
+                continue
+            if entry.is_file():
+                files.append(Path(entry.path))
+        except OSError:
+            continue
+
+    yield from pair_files(files)
+    for subdir in subdirs:
+        yield from scan_images(subdir)
+
+def pair_files(paths):
+    """Yield a ScanItem per image among paths, in order, with the RAW files among paths that belong to it.
+
+    A RAW file belongs to an image with the same stem in the same directory.
+    Only the first such image gets it, e.g. not both of x.jpg and x.png.
+    Other files are ignored.
+    """
+    images = []
+    raws = {}
+    for path in paths:
+        path = Path(path)
+        key = (path.parent, path.stem.lower())
+        ext = path.suffix.lower()
+        if ext in IMAGE_EXTENSIONS:
+            images.append((key, path))
+        elif ext in RAW_EXTENSIONS:
+            raws.setdefault(key, []).append(path)
+    for key, image_path in images:
+        yield ScanItem(image_path, raws.pop(key, []))
+
+class BackgroundScanner:
+    """Run scan_images on a background thread.
+
+    Iterating yields ScanItems as soon as they are found, while count keeps
+    growing. Once complete is set, count is the total and elapsed the
+    seconds the scan took. Given paths, only those are paired up instead of
+    scanning root.
+    """
+
+    def __init__(self, root, paths=None):
+        self.paths = paths
+        self.count = 0
+        self.complete = False
+        self.elapsed = 0.0
+        self.queue = Queue()
+        self.thread = threading.Thread(target=self._scan, args=(root,), daemon=True)
+        self.thread.start()
+
+    def _scan(self, root):
+        start = time.perf_counter()
+        try:
+            for item in scan_images(root) if self.paths is None else pair_files(self.paths):
+                self.count += 1
+                self.queue.put(item)
+        finally:
+            self.elapsed = time.perf_counter() - start
+            self.complete = True
+            self.queue.put(None)
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            yield item
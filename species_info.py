@@ -0,0 +1,104 @@
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import APP_DIR
+from store import SQLiteStore
+
+DEFAULT_SPECIES_INFO_PATH = APP_DIR / 'species_info.sqlite3'
+PREFETCH_WORKERS = 2
+
+def species_key(bird_name):
+    return ' '.join(bird_name.split()).lower()
+
+def scientific_name(info_text):
+    """Return the scientific name from the "Scientific name:" line of an info text, or None."""
+    for line in (info_text or '').splitlines():
+        name, _, value = line.strip().partition(':')
+        if name.strip().lower() == 'scientific name' and value.strip():
+            return value.strip().strip('*_ ')
+    return None
+
+class SpeciesInfoStore(SQLiteStore):
+    """Persistent store of the info.txt text for each species, shared by all folders."""
+
+    def __init__(self, path=DEFAULT_SPECIES_INFO_PATH):
+        super().__init__(path, ["""
+            CREATE TABLE IF NOT EXISTS species_info (
+                species TEXT PRIMARY KEY,
+                bird_name TEXT NOT NULL,
+                info_text TEXT NOT NULL,
+                fetched REAL NOT NULL
+            )
+        """])
+
+    def get(self, bird_name):
+        """Return the stored info text for a species, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT info_text FROM species_info WHERE species = ?", (species_key(bird_name),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, bird_name, info_text):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO species_info VALUES (?, ?, ?, ?)",
+                (species_key(bird_name), bird_name, info_text, time.time())
+            )
+            self.conn.commit()
+
+class SpeciesInfoPrefetcher:
+    """Fetch species info in the background into a SpeciesInfoStore.
+
+    fetch(bird_name) returns the info text or None on failure. Each species
+    is requested at most once per prefetcher, and not at all if the store
+    already has it.
+    """
+
+    def __init__(self, store, fetch, workers=PREFETCH_WORKERS):
+        self.store = store
+        self.fetch = fetch
+        self.requested = set()
+        self.futures = []
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def request(self, bird_name):
+        key = species_key(bird_name)
+        if key in self.requested:
+            return
+        self.requested.add(key)
+        if self.store.get(bird_name) is None:
+            self.futures.append(self.executor.submit(self._fetch, bird_name))
+
+    def _fetch(self, bird_name):
+        try:
+            info_text = self.fetch(bird_name)
+        except Exception as e:
+            print(f"Error fetching info for {bird_name}: {str(e)}", file=sys.stderr)
+            return
+        if info_text:
+            self.store.put(bird_name, info_text)
+
+    def pending(self):
+        return sum(1 for future in self.futures if not future.done())
+
+    def close(self, wait=True):
+        """Stop taking requests. Fetches already requested still finish, wait blocks until they do."""
+        self.executor.shutdown(wait=wait)
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_species_info_store():
+    """Return the store shared by the whole process.
+
+    It is never closed, so fetches still running after a distribution can
+    finish writing to it.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SpeciesInfoStore()
+        return _store
@@ -0,0 +1,77 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from gui import STARTUP_BENCHMARK_ENV
+
+# Modules that are slow to import and should wait until they are needed
+HEAVY_MODULES = ['requests', 'numpy', 'PIL', 'dotenv']
+
+def time_to_first_window(command, timeout=300):
+    """Launch command and return the seconds until its window first showed."""
+    with tempfile.TemporaryDirectory() as tmp:
+        marker = os.path.join(tmp, 'first-window')
+        env = dict(os.environ, **{STARTUP_BENCHMARK_ENV: marker})
+        start = time.time()
+        subprocess.run(command, env=env, timeout=timeout, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        with open(marker) as f:
+            return float(f.read()) - start
+
+def heavy_modules_at_startup():
+    """Return the HEAVY_MODULES loaded by importing the app, before anything is done with it."""
+    code = (
+        "import sys, main, gui; "
+        f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    return output.stdout.split()
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the time from launching the app to its window showing. "
+                    "Needs a display (e.g. run under xvfb-run on a server)."
+    )
+    parser.add_argument('executable', nargs='?', default=None,
+                        help="Built app to measure, e.g. dist/BirdClassifier/BirdClassifier "
+                             "(default: main.py with this Python)")
+    parser.add_argument('--runs', type=int, default=5,
+                        help="Number of launches, the first is reported separately as the cold start")
+    parser.add_argument('--output', default=None, metavar='FILE',
+                        help="Also write the results as JSON to FILE")
+    args = parser.parse_args()
+
+    if args.executable:
+        command = [os.path.abspath(args.executable)]
+    else:
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')]
+
+    times = []
+    for run in range(args.runs):
+        seconds = time_to_first_window(command)
+        print(f"Run {run + 1}: {seconds:.3f}s", file=sys.stderr)
+        times.append(seconds)
+
+    results = {
+        'command': command,
+        'runs': len(times),
+        'cold_seconds': round(times[0], 3),
+        'median_seconds': round(statistics.median(times), 3),
+        'min_seconds': round(min(times), 3),
+        'max_seconds': round(max(times), 3)
+    }
+    if not args.executable:
+        results['heavy_modules_at_startup'] = heavy_modules_at_startup()
+    print(json.dumps(results))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
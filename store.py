@@ -0,0 +1,75 @@
+import sqlite3
+import threading
+from pathlib import Path
+
+# Access times noted by LRUStore.touch before they are written
+TOUCH_BATCH = 64
+
+class SQLiteStore:
+    """A SQLite file of the app, with one connection shared by the threads of a process.
+
+    The stores are used from worker threads, loader threads and the GUI
+    thread alike, so the connection is opened with check_same_thread=False
+    and every use of it, by subclasses too, holds self.lock: a connection
+    must not be used from two threads at once. Other processes open their
+    own connection and SQLite's file locking keeps them apart, so writes
+    are committed before the lock is released; an open write transaction
+    would hold other processes off the file until it ends.
+    """
+
+    def __init__(self, path, schema):
+        self.lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        for statement in schema:
+            self.conn.execute(statement)
+        self.conn.commit()
+
+    def _closing(self):
+        """Called with the lock held, just before the connection is closed."""
+
+    def close(self):
+        with self.lock:
+            self._closing()
+            self.conn.close()
+
+class LRUStore(SQLiteStore):
+    """SQLiteStore of a table with a last_used column, trimmed to its max_entries most recently used rows.
+
+    Rows are identified by key_columns. Lookups note their access time with
+    touch(), and the noted times are written together by _commit(), with
+    the next write, every TOUCH_BATCH lookups or on close, so reads don't
+    each need a write transaction.
+    """
+
+    def __init__(self, path, schema, table, key_columns, max_entries):
+        super().__init__(path, schema)
+        self.table = table
+        self.key_columns = key_columns
+        self.max_entries = max_entries
+        self.touched = {}
+
+    def touch(self, key, now):
+        """Note that the row with key (a tuple of key_columns values) was used at now. Call with the lock held."""
+        self.touched[key] = now
+        if len(self.touched) >= TOUCH_BATCH:
+            self._commit()
+
+    def _commit(self):
+        """Write the noted access times, trim the table and commit. Call with the lock held."""
+        if self.touched:
+            where = ' AND '.join(f"{column} = ?" for column in self.key_columns)
+            self.conn.executemany(f"UPDATE {self.table} SET last_used = ? WHERE {where}",
+                                  [(now, *key) for key, now in self.touched.items()])
+            self.touched = {}
+        count = self.conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute(
+                f"DELETE FROM {self.table} WHERE rowid IN "
+                f"(SELECT rowid FROM {self.table} ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,)
+            )
+        self.conn.commit()
+
+    def _closing(self):
+        self._commit()
@@ -0,0 +1,258 @@
+import csv
+import re
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+
+from cache import APP_DIR
+
+# A species checklist CSV, e.g. the eBird/Clements taxonomy from https://www.birds.cornell.edu/clementschecklist/
+DEFAULT_TAXONOMY_PATH = APP_DIR / 'taxonomy.csv'
+# Optional alias,canonical CSV of extra names for species
+DEFAULT_ALIASES_PATH = APP_DIR / 'species_aliases.csv'
+# Optional regional checklists, one file per region named after it, e.g. "Karnataka.csv"
+DEFAULT_CHECKLISTS_DIR = APP_DIR / 'checklists'
+
+# Header names of the columns, in the eBird and Clements spellings
+COMMON_NAME_COLUMNS = ['primary_com_name', 'english name', 'common name', 'common_name', 'english']
+SCIENTIFIC_NAME_COLUMNS = ['sci_name', 'scientific name', 'scientific_name']
+CODE_COLUMNS = ['species_code']
+CATEGORY_COLUMNS = ['category']
+
+# Spellings that differ between checklists and between what the model answers
+SPELLING_VARIANTS = [('grey', 'gray'), ('colour', 'color'), ('moustached', 'mustached')]
+
+# Fuzzy matches scoring below this (Dice coefficient of trigrams) are not trusted
+MIN_SIMILARITY = 0.7
+
+def normalize(name):
+    """Lowercase letters and single spaces, so hyphens, apostrophes and case don't matter."""
+    name = name.lower().replace("'", '')
+    return ' '.join(re.sub(r'[^a-z]+', ' ', name).split())
+
+def token_key(name):
+    """normalize(name) with the words sorted, so "Robin Indian" finds "Indian Robin"."""
+    return ' '.join(sorted(name.split()))
+
+def spelling_key(name):
+    for british, american in SPELLING_VARIANTS:
+        name = re.sub(rf'\b{british}\b', american, name)
+    return name
+
+def trigrams(name):
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _column(header, names):
+    for n, field in enumerate(header):
+        if field.strip().lower() in names:
+            return n
+    return None
+
+class Taxonomy:
+    """In-memory index of a species checklist that maps the names the model returns to canonical ones.
+
+    Names are looked up exactly (after normalize), by their words in any
+    order, with British or American spelling, as scientific names, eBird
+    species codes or entries of the aliases file, and otherwise by trigram
+    similarity. With regional checklists, the regions named in the location
+    hint narrow down the fuzzy candidates. Files are read on the first
+    lookup and lookups are memoized, so a shoot pays for each distinct
+    answer once. Without a taxonomy file nothing is canonicalized.
+    """
+
+    def __init__(self, path=DEFAULT_TAXONOMY_PATH, aliases_path=DEFAULT_ALIASES_PATH,
+                 checklists_dir=DEFAULT_CHECKLISTS_DIR):
+        self.path = Path(path) if path else None
+        self.aliases_path = Path(aliases_path) if aliases_path else None
+        self.checklists_dir = Path(checklists_dir) if checklists_dir else None
+        self.lock = threading.Lock()
+        self.species = None
+        self.memo = {}
+
+    def _add_key(self, key, index):
+        for variant in {key, token_key(key), spelling_key(key), token_key(spelling_key(key))}:
+            self.keys.setdefault(variant, index)
+
+    def _add_name(self, name, index):
+        """Index name as a name of the species at index."""
+        key = normalize(name)
+        if not key:
+            return
+        self._add_key(key, index)
+        entry = len(self.names)
+        grams = trigrams(spelling_key(key))
+        self.names.append((spelling_key(key), index, len(grams)))
+        for gram in grams:
+            self.grams.setdefault(gram, []).append(entry)
+
+    def _load(self):
+        # Canonical names, exact keys to species, fuzzy names and the trigram index over them
+        self.species = []
+        self.keys = {}
+        self.names = []
+        self.grams = {}
+        self.regions = {}
+        self.region_species = {}
+        if not self.path or not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8-sig', newline='') as f:
+                rows = csv.reader(f)
+                header = next(rows, [])
+                common = _column(header, COMMON_NAME_COLUMNS)
+                scientific = _column(header, SCIENTIFIC_NAME_COLUMNS)
+                code = _column(header, CODE_COLUMNS)
+                category = _column(header, CATEGORY_COLUMNS)
+                if common is None:
+                    print(f"No common name column in {self.path}", file=sys.stderr)
+                    return
+                for row in rows:
+                    if len(row) <= common or not row[common].strip():
+                        continue
+                    # Keep species, not hybrids, slashes, spuhs and the like
+                    if category is not None and len(row) > category and row[category].strip().lower() != 'species':
+                        continue
+                    index = len(self.species)
+                    self.species.append(row[common].strip())
+                    self._add_name(row[common], index)
+                    for column in (scientific, code):
+                        if column is not None and len(row) > column and row[column].strip():
+                            self._add_key(normalize(row[column]), index)
+        except (OSError, csv.Error) as e:
+            print(f"Error reading taxonomy {self.path}: {str(e)}", file=sys.stderr)
+            return
+        self._load_aliases()
+        self._load_checklists()
+
+    def _load_aliases(self):
+        if not self.aliases_path or not self.aliases_path.exists():
+            return
+        try:
+            with open(self.aliases_path, 'r', encoding='utf-8-sig', newline='') as f:
+                for row in csv.reader(f):
+                    if len(row) < 2 or row[0].startswith('#'):
+                        continue
+                    index = self.keys.get(normalize(row[1]))
+                    if index is None:
+                        print(f"Alias {row[0]!r} names an unknown species {row[1]!r}", file=sys.stderr)
+                    else:
+                        self._add_name(row[0], index)
+        except (OSError, csv.Error) as e:
+            print(f"Error reading species aliases {self.aliases_path}: {str(e)}", file=sys.stderr)
+
+    def _load_checklists(self):
+        """Read each checklist into the set of species of its region, keyed by the normalized region name."""
+        if not self.checklists_dir or not self.checklists_dir.is_dir():
+            return
+        for path in sorted(self.checklists_dir.iterdir()):
+            if path.suffix.lower() not in ['.csv', '.txt']:
+                continue
+            members = set()
+            try:
+                with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+                    rows = csv.reader(f)
+                    header = next(rows, [])
+                    common = _column(header, COMMON_NAME_COLUMNS)
+                    if common is None:
+                        # A plain list of names, the first line is a name too
+                        common = 0
+                        rows = [header] + list(rows)
+                    for row in rows:
+                        if len(row) > common:
+                            index = self._exact(normalize(row[common]))
+                            if index is not None:
+                                members.add(index)
+            except (OSError, csv.Error) as e:
+                print(f"Error reading checklist {path}: {str(e)}", file=sys.stderr)
+                continue
+            if members:
+                self.regions[normalize(path.stem)] = members
+
+    def _exact(self, key):
+        for variant in (key, token_key(key), spelling_key(key), token_key(spelling_key(key))):
+            index = self.keys.get(variant)
+            if index is not None:
+                return index
+        return None
+
+    def regions_in(self, location):
+        """Return the names of the regions with a checklist that location mentions, as a tuple."""
+        if not location or not self.regions:
+            return ()
+        text = f" {normalize(location)} "
+        return tuple(region for region in self.regions if f" {region} " in text)
+
+    def regional_species(self, regions):
+        """Return the species on the checklists of regions, or None without regions."""
+        if not regions:
+            return None
+        if regions not in self.region_species:
+            self.region_species[regions] = set().union(*(self.regions[region] for region in regions))
+        return self.region_species[regions]
+
+    def _fuzzy(self, key, candidates):
+        """Return the species whose names are most similar to key, limited to candidates if given."""
+        key = spelling_key(key)
+        query = trigrams(key)
+        shared = Counter()
+        for gram in query:
+            for entry in self.grams.get(gram, ()):
+                shared[entry] += 1
+        best = None
+        best_score = MIN_SIMILARITY
+        for entry, count in shared.items():
+            _, index, size = self.names[entry]
+            if candidates is not None and index not in candidates:
+                continue
+            score = 2 * count / (len(query) + size)
+            if score > best_score:
+                best, best_score = index, score
+        if best is not None:
+            return best
+        # A partial name like "Robin" is only trusted if one candidate has all its words
+        words = set(key.split())
+        matches = {index for name, index, _ in self.names
+                   if (candidates is None or index in candidates) and words <= set(name.split())}
+        return matches.pop() if len(matches) == 1 else None
+
+    def canonical_name(self, name, location=None):
+        """Return the canonical name of the species name stands for, or None if it isn't recognized."""
+        key = normalize(name or '')
+        if not key:
+            return None
+        with self.lock:
+            if self.species is None:
+                self._load()
+            if not self.species:
+                return None
+            regions = self.regions_in(location)
+            memo_key = (key, regions)
+            if memo_key not in self.memo:
+                index = self._exact(key)
+                if index is None and regions:
+                    index = self._fuzzy(key, self.regional_species(regions))
+                if index is None:
+                    index = self._fuzzy(key, None)
+                self.memo[memo_key] = self.species[index] if index is not None else None
+            return self.memo[memo_key]
+
+_taxonomy = None
+_taxonomy_lock = threading.Lock()
+
+def configure_taxonomy(path=DEFAULT_TAXONOMY_PATH, aliases_path=DEFAULT_ALIASES_PATH,
+                       checklists_dir=DEFAULT_CHECKLISTS_DIR):
+    """Use the given taxonomy, aliases and checklists from now on."""
+    global _taxonomy
+    with _taxonomy_lock:
+        _taxonomy = Taxonomy(path, aliases_path, checklists_dir)
+        return _taxonomy
+
+def get_taxonomy():
+    """Return the shared taxonomy, reading the default files unless configured otherwise."""
+    global _taxonomy
+    with _taxonomy_lock:
+        if _taxonomy is None:
+            _taxonomy = Taxonomy()
+        return _taxonomy
@@ -0,0 +1,29 @@
+import threading
+
+from thumbnails import ThumbnailLoader
+
+class FakeCache:
+    def get(self, content_hash, mtime, size):
+        return b'thumbnail'
+
+def test_request_before_want_is_loaded(tmp_path):
+    photo = tmp_path / 'DSC_0001.JPG'
+    photo.write_bytes(b'not really a jpeg')
+    ready = {}
+    loaded = threading.Event()
+
+    def on_ready(image_path, data):
+        ready[image_path] = data
+        loaded.set()
+
+    loader = ThumbnailLoader(FakeCache(), on_ready, workers=1)
+    try:
+        # The order the gallery used to call them in
+        loader.request(str(photo), 'hash')
+        loader.want([str(photo)])
+        assert loaded.wait(10)
+    finally:
+        loader.close()
+
+    assert ready == {str(photo): b'thumbnail'}
+    assert not loader.pending
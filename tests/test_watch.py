@@ -0,0 +1,69 @@
+import threading
+import time
+from pathlib import Path
+
+import watch
+
+class EmptyIndex:
+    def originals_under(self, directory):
+        return set()
+
+    def close(self):
+        pass
+
+def test_file_written_just_before_startup_is_classified(tmp_path, monkeypatch):
+    photo = tmp_path / 'DSC_0001.JPG'
+    photo.write_bytes(b'not really a jpeg')
+    classified = []
+    stop = threading.Event()
+
+    def fake_classify_folder(input_dir, api_key, paths=None, **options):
+        classified.extend(Path(path) for path in paths)
+        stop.set()
+        yield {'type': 'done'}
+
+    monkeypatch.setattr(watch, 'PhotoIndex', EmptyIndex)
+    monkeypatch.setattr(watch, 'classify_folder', fake_classify_folder)
+    # Stop waiting for it eventually, whatever happens
+    timer = threading.Timer(10, stop.set)
+    timer.start()
+    try:
+        start = time.monotonic()
+        list(watch.watch_folder(tmp_path, 'key', stop=stop, poll_interval=0.2, settle=0.5))
+    finally:
+        timer.cancel()
+
+    assert classified == [photo]
+    # Only once it had settled
+    assert time.monotonic() - start >= 0.5
+
+def test_raw_settling_after_its_image_follows_it(tmp_path, monkeypatch):
+    (tmp_path / 'DSC_0001.JPG').write_bytes(b'not really a jpeg')
+    stop = threading.Event()
+    classified = []
+    placed = []
+
+    def fake_classify_folder(input_dir, api_key, paths=None, **options):
+        classified.append(sorted(Path(path).name for path in paths))
+        # The RAW lands once the image is done
+        (tmp_path / 'DSC_0001.NEF').write_bytes(b'not really a raw')
+        yield {'type': 'done'}
+
+    def fake_place_late_raws(input_dir, pairs, placement, xmp_naming):
+        placed.extend((Path(raw).name, Path(image).name) for raw, image in pairs)
+        if placed:
+            stop.set()
+        return []
+
+    monkeypatch.setattr(watch, 'PhotoIndex', EmptyIndex)
+    monkeypatch.setattr(watch, 'classify_folder', fake_classify_folder)
+    monkeypatch.setattr(watch, 'place_late_raws', fake_place_late_raws)
+    timer = threading.Timer(10, stop.set)
+    timer.start()
+    try:
+        list(watch.watch_folder(tmp_path, 'key', stop=stop, poll_interval=0.2, settle=0.3))
+    finally:
+        timer.cancel()
+
+    assert classified == [['DSC_0001.JPG']]
+    assert placed == [('DSC_0001.NEF', 'DSC_0001.JPG')]
@@ -0,0 +1,162 @@
+import io
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from cache import APP_DIR
+from store import LRUStore
+
+DEFAULT_THUMBNAILS_PATH = APP_DIR / 'thumbnails.sqlite3'
+# About 5 KB each at the default size
+DEFAULT_MAX_THUMBNAILS = 50000
+THUMBNAIL_SIZE = 128
+THUMBNAIL_QUALITY = 80
+
+def make_thumbnail(image_path, size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY):
+    """Return a JPEG thumbnail of an image, at most size pixels on its long edge."""
+    from PIL import Image, ImageOps
+
+    with Image.open(image_path) as img:
+        # Let the JPEG decoder scale down while decoding
+        img.draft('RGB', (size, size))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((size, size))
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+class ThumbnailCache(LRUStore):
+    """SQLite store of JPEG thumbnails, shared by all folders.
+
+    Thumbnails are keyed by the content hash of the photo and the
+    modification time of the file they were made from, so a copy or a move
+    of a photo still hits, and an edited one is made again. When the store
+    grows past max_entries the least recently used thumbnails are evicted.
+    """
+
+    def __init__(self, path=DEFAULT_THUMBNAILS_PATH, max_entries=DEFAULT_MAX_THUMBNAILS):
+        super().__init__(path, [
+            """
+            CREATE TABLE IF NOT EXISTS thumbnails (
+                content_hash TEXT NOT NULL,
+                mtime INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (content_hash, mtime, size)
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS thumbnails_last_used ON thumbnails (last_used)"
+        ], 'thumbnails', ['content_hash', 'mtime', 'size'], max_entries)
+
+    def get(self, content_hash, mtime, size=THUMBNAIL_SIZE):
+        """Return the JPEG bytes of a thumbnail, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT data FROM thumbnails WHERE content_hash = ? AND mtime = ? AND size = ?",
+                (content_hash, mtime, size)
+            ).fetchone()
+            if row is None:
+                return None
+            self.touch((content_hash, mtime, size), time.time())
+        return row[0]
+
+    def put(self, content_hash, mtime, data, size=THUMBNAIL_SIZE):
+        with self.lock:
+            # Thumbnails of an older version of the file are of no use any more
+            self.conn.execute("DELETE FROM thumbnails WHERE content_hash = ? AND size = ? AND mtime != ?",
+                              (content_hash, size, mtime))
+            self.conn.execute("INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?, ?)",
+                              (content_hash, mtime, size, data, time.time()))
+            self._commit()
+
+class ThumbnailLoader:
+    """Load thumbnails in the background, from the ThumbnailCache or by making them on a process pool.
+
+    on_ready(image_path, data) is called from a background thread with the
+    JPEG bytes, or None if the image can't be read. Only images passed to
+    want() most recently are loaded, requests for the others are dropped
+    when their turn comes, so scrolling past thousands of photos only loads
+    the ones that stayed on screen.
+    """
+
+    def __init__(self, cache, on_ready, size=THUMBNAIL_SIZE, workers=None):
+        self.cache = cache
+        self.on_ready = on_ready
+        self.size = size
+        self.lock = threading.Lock()
+        self.wanted = set()
+        self.pending = set()
+        # Stats and cache lookups are cheap, thumbnails are decoded on the pool
+        self.lookups = ThreadPoolExecutor(max_workers=2)
+        self.pool = ProcessPoolExecutor(max_workers=workers or max(1, (os.cpu_count() or 2) - 1))
+
+    def want(self, image_paths):
+        """Replace the set of images whose thumbnails are needed."""
+        with self.lock:
+            self.wanted = set(image_paths)
+
+    def request(self, image_path, content_hash):
+        """Load the thumbnail of an image, unless it is already on its way. The image becomes wanted."""
+        with self.lock:
+            # Else a request made before the want() of its redraw is dropped
+            self.wanted.add(image_path)
+            if image_path in self.pending:
+                return
+            self.pending.add(image_path)
+        self.lookups.submit(self._load, image_path, content_hash)
+
+    def _still_wanted(self, image_path):
+        with self.lock:
+            if image_path in self.wanted:
+                return True
+            # Scrolled away, it is requested again if it comes back
+            self.pending.discard(image_path)
+            return False
+
+    def _done(self, image_path, data):
+        with self.lock:
+            self.pending.discard(image_path)
+        self.on_ready(image_path, data)
+
+    def _load(self, image_path, content_hash):
+        if not self._still_wanted(image_path):
+            return
+        try:
+            mtime = os.stat(image_path).st_mtime_ns
+        except OSError:
+            return self._done(image_path, None)
+        # Photos without a hash are keyed by their path
+        key = content_hash or f"path:{image_path}"
+        data = self.cache.get(key, mtime, self.size)
+        if data is not None:
+            return self._done(image_path, data)
+        if not self._still_wanted(image_path):
+            return
+        future = self.pool.submit(make_thumbnail, image_path, self.size)
+        future.add_done_callback(lambda future: self._made(image_path, key, mtime, future))
+
+    def _made(self, image_path, key, mtime, future):
+        if future.cancelled():
+            return
+        try:
+            data = future.result()
+        except Exception:
+            return self._done(image_path, None)
+        try:
+            self.cache.put(key, mtime, data, self.size)
+        except sqlite3.Error:
+            # Closed meanwhile, the thumbnail is still good to show
+            pass
+        self._done(image_path, data)
+
+    def close(self):
+        """Stop loading. Thumbnails being made are finished in the background."""
+        with self.lock:
+            self.wanted = set()
+        self.lookups.shutdown(wait=False, cancel_futures=True)
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,79 @@
+import threading
+
+# USD per million (prompt, output) tokens, from https://ai.google.dev/pricing
+PRICES = {
+    'gemini-2.0-flash': (0.10, 0.40),
+}
+DEFAULT_PRICE = PRICES['gemini-2.0-flash']
+
+def estimate_tokens(text):
+    """Rough token count of English text, about 4 characters per token."""
+    return (len(text) + 3) // 4
+
+class UsageStats:
+    """Token usage and cost of the API requests of a run.
+
+    The counts come from the usageMetadata of each response. A request for
+    several images is split evenly between them for the per-image figures.
+    With a budget in USD, over_budget() turns True once the run has cost
+    that much; requests already in flight then still add to it. Requests are
+    recorded from the worker threads.
+    """
+
+    def __init__(self, model, budget=None):
+        self.price = PRICES.get(model, DEFAULT_PRICE)
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.max_prompt_tokens = 0
+        self.context_tokens = 0
+        self.cost = 0.0
+        # Usage of the request each image was identified in, by content hash
+        self.image_usage = {}
+
+    def record(self, response, content_hashes=(), context_tokens=0):
+        """Record a response to a request for the images with the given content hashes."""
+        metadata = response.get('usageMetadata') or {}
+        prompt_tokens = metadata.get('promptTokenCount') or 0
+        output_tokens = (metadata.get('candidatesTokenCount') or 0) + (metadata.get('thoughtsTokenCount') or 0)
+        cost = (prompt_tokens * self.price[0] + output_tokens * self.price[1]) / 1e6
+        with self.lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.output_tokens += output_tokens
+            self.max_prompt_tokens = max(self.max_prompt_tokens, prompt_tokens)
+            self.context_tokens += context_tokens
+            self.cost += cost
+            for content_hash in content_hashes:
+                # An image localized before it was identified has two requests, both count
+                entry = self.image_usage.setdefault(content_hash, {
+                    'prompt_tokens': 0, 'output_tokens': 0, 'request_images': 0, 'cost': 0.0
+                })
+                entry['prompt_tokens'] += prompt_tokens
+                entry['output_tokens'] += output_tokens
+                entry['request_images'] = max(entry['request_images'], len(content_hashes))
+                entry['cost'] += cost / len(content_hashes)
+
+    def pop_image(self, content_hash):
+        """Return and forget the usage of the request an image was identified in, or None."""
+        with self.lock:
+            return self.image_usage.pop(content_hash, None)
+
+    def over_budget(self):
+        with self.lock:
+            return self.budget is not None and self.cost >= self.budget
+
+    def summary(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'prompt_tokens': self.prompt_tokens,
+                'output_tokens': self.output_tokens,
+                'mean_prompt_tokens': round(self.prompt_tokens / self.requests, 1) if self.requests else 0,
+                'max_prompt_tokens': self.max_prompt_tokens,
+                'mean_context_tokens': round(self.context_tokens / self.requests, 1) if self.requests else 0,
+                'cost': round(self.cost, 6),
+                'budget': self.budget
+            }
@@ -0,0 +1,252 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+
+from classifier import classify_folder, place_late_raws
+from photo_index import PhotoIndex
+from placement import COPY
+from scanner import IMAGE_EXTENSIONS, RAW_EXTENSIONS, is_skipped_dir, scan_images
+from xmp import ADOBE
+
+# How often the tree is listed where inotify is not available
+DEFAULT_POLL_INTERVAL = 5.0
+# Files are classified once their size and modification time have not changed for this long
+DEFAULT_SETTLE_SECONDS = 2.0
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct('iIII')
+
+def is_watched_file(name):
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS + RAW_EXTENSIONS
+
+def walk_files(root):
+    """Yield the image and RAW files in root and its subfolders, skipping our output folders."""
+    for directory, subdirs, files in os.walk(root):
+        subdirs[:] = [name for name in subdirs if not is_skipped_dir(name)]
+        for name in files:
+            if is_watched_file(name):
+                yield os.path.join(directory, name)
+
+class InotifyWatcher:
+    """Report files written or moved into a directory tree, through Linux inotify.
+
+    Raises OSError where inotify is not available.
+    """
+
+    def __init__(self, root):
+        if not sys.platform.startswith('linux'):
+            raise OSError("inotify is only available on Linux")
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.dirs = {}
+        self._watch_tree(root)
+
+    def _watch_tree(self, root):
+        """Watch root and its subfolders, and return the files already in them."""
+        found = []
+        for directory, subdirs, files in os.walk(root):
+            subdirs[:] = [name for name in subdirs if not is_skipped_dir(name)]
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                print(f"Error watching {directory}: {os.strerror(ctypes.get_errno())}", file=sys.stderr)
+                continue
+            self.dirs[wd] = directory
+            found.extend(os.path.join(directory, name) for name in files if is_watched_file(name))
+        return found
+
+    def read(self, timeout):
+        """Wait up to timeout seconds and return the paths of files that arrived."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 65536)
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, look at everything again
+                for root in list(self.dirs.values()):
+                    paths.extend(os.path.join(root, entry) for entry in os.listdir(root) if is_watched_file(entry))
+                continue
+            if wd not in self.dirs:
+                continue
+            name = os.fsdecode(name)
+            path = os.path.join(self.dirs[wd], name)
+            if mask & IN_ISDIR:
+                if not is_skipped_dir(name):
+                    # Files may have landed in a new folder before it was watched
+                    paths.extend(self._watch_tree(path))
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and is_watched_file(name):
+                paths.append(path)
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """Report new files in a directory tree by listing it every interval seconds."""
+
+    def __init__(self, root, interval=DEFAULT_POLL_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self.seen = set()
+        self.last_poll = 0
+
+    def read(self, timeout):
+        wait = self.last_poll + self.interval - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(0, wait))
+        self.last_poll = time.monotonic()
+        paths = [path for path in walk_files(self.root) if path not in self.seen]
+        self.seen.update(paths)
+        return paths
+
+    def close(self):
+        pass
+
+class FolderWatcher:
+    """Watch a folder tree for new photos, with inotify where possible and polling otherwise.
+
+    Files are only reported once they have settled, so photos still being
+    copied off a card are not picked up half written. Files in known are
+    never reported.
+    """
+
+    def __init__(self, root, known=(), poll_interval=DEFAULT_POLL_INTERVAL, settle=DEFAULT_SETTLE_SECONDS):
+        self.settle = settle
+        self.known = set(known)
+        self.candidates = {}
+        try:
+            self.watcher = InotifyWatcher(root)
+        except (OSError, AttributeError) as e:
+            print(f"Watching {root} by polling, inotify is not available: {str(e)}", file=sys.stderr)
+            self.watcher = PollingWatcher(root, poll_interval)
+
+    def track(self, paths):
+        """Report paths once they have settled, like files that arrived."""
+        for path in paths:
+            if str(path) not in self.known:
+                self.candidates.setdefault(str(path), None)
+
+    def batches(self, stop=None):
+        """Yield sorted lists of the files that arrived, until stop (a threading.Event) is set."""
+        while not (stop and stop.is_set()):
+            self.track(self.watcher.read(timeout=max(self.settle / 2, 0.1)))
+            ready = []
+            now = time.monotonic()
+            for path, previous in list(self.candidates.items()):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    # Gone again
+                    del self.candidates[path]
+                    continue
+                signature = (stat.st_size, stat.st_mtime)
+                if previous and previous[0] == signature:
+                    if now - previous[1] >= self.settle:
+                        ready.append(path)
+                        del self.candidates[path]
+                        self.known.add(path)
+                else:
+                    self.candidates[path] = (signature, now)
+            if ready:
+                yield sorted(ready)
+
+    def close(self):
+        self.watcher.close()
+
+def split_late_raws(paths):
+    """Split paths into the RAW files whose image is not among them but on disk, as (RAW, image) pairs, and the rest."""
+    stems = {(os.path.dirname(path), Path(path).stem.lower()) for path in paths
+             if Path(path).suffix.lower() in IMAGE_EXTENSIONS}
+    late = []
+    rest = []
+    for path in paths:
+        directory = os.path.dirname(path)
+        stem = Path(path).stem.lower()
+        if Path(path).suffix.lower() in RAW_EXTENSIONS and (directory, stem) not in stems:
+            try:
+                # The first one, as the scanner pairs them
+                image = next((os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                              if Path(name).stem.lower() == stem and Path(name).suffix.lower() in IMAGE_EXTENSIONS),
+                             None)
+            except OSError:
+                image = None
+            if image:
+                late.append((path, image))
+                continue
+        rest.append(path)
+    return late, rest
+
+def watch_folder(input_dir, api_key, stop=None, poll_interval=DEFAULT_POLL_INTERVAL,
+                 settle=DEFAULT_SETTLE_SECONDS, **options):
+    """Classify the photos in input_dir not classified yet, then the new ones as they arrive.
+
+    This is a generator of classify_folder messages, one run per batch of
+    arrivals, until stop is set. Photos already in the photo index are not
+    classified again, and after the first scan the tree is not scanned
+    again (except by the polling fallback). RAW files that settle after
+    their image was classified are put beside its output (see
+    classifier.place_late_raws). options are passed on to classify_folder.
+    """
+    input_dir = Path(input_dir)
+    # Watch first, so nothing that arrives during the first run is missed
+    watcher = FolderWatcher(input_dir, poll_interval=poll_interval, settle=settle)
+    try:
+        index = PhotoIndex()
+        try:
+            done = index.originals_under(input_dir)
+        finally:
+            index.close()
+
+        pending = []
+        late = []
+        for item in scan_images(input_dir):
+            files = [item.path] + item.sidecars
+            try:
+                if time.time() - max(os.path.getmtime(path) for path in files) < settle:
+                    # Maybe still being written, inotify won't report it again, so it settles with the arrivals
+                    watcher.track(files)
+                    continue
+            except OSError:
+                continue
+            watcher.known.update(str(path) for path in files)
+            if str(item.path.resolve()) not in done:
+                pending.extend(files)
+            else:
+                # Copied in since the image was classified
+                late.extend((str(path), str(item.path)) for path in item.sidecars if str(path.resolve()) not in done)
+        if pending:
+            yield from classify_folder(input_dir, api_key, paths=pending, **options)
+        # Late RAW files whose image is not classified yet wait for it
+        waiting = place_late_raws(input_dir, late, options.get('placement', COPY), options.get('xmp_naming', ADOBE))
+
+        for batch in watcher.batches(stop):
+            late, paths = split_late_raws(batch + [raw_path for raw_path, _ in waiting])
+            if paths:
+                yield from classify_folder(input_dir, api_key, paths=[Path(path) for path in paths], **options)
+            # Settled after their image was placed, they follow it there
+            waiting = place_late_raws(input_dir, late, options.get('placement', COPY),
+                                      options.get('xmp_naming', ADOBE))
+    finally:
+        watcher.close()
@@ -0,0 +1,214 @@
+import io
+import os
+import sys
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from pathlib import Path
+
+# Sidecar names: IMG_0001.xmp as Lightroom expects next to RAW files, or IMG_0001.NEF.xmp as darktable and
+# digiKam expect next to any file
+ADOBE = 'adobe'
+DARKTABLE = 'darktable'
+NAMINGS = [ADOBE, DARKTABLE]
+
+# Sidecars changed before they are written out together
+XMP_BATCH_SIZE = 100
+BLURRED_KEYWORD = 'Blurred'
+
+NAMESPACES = {
+    'x': 'adobe:ns:meta/',
+    'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+    'dc': 'http://purl.org/dc/elements/1.1/',
+    'birdclassifier': 'https://github.com/madhavanmalolan/bird-photos-classifier/ns/1.0/',
+}
+for _prefix, _uri in NAMESPACES.items():
+    ET.register_namespace(_prefix, _uri)
+
+PACKET_HEADER = '<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?>\n'
+PACKET_TRAILER = '\n<?xpacket end="w"?>\n'
+
+# What a sidecar says about its photo; a photo without a bird has species None
+XmpTags = namedtuple('XmpTags', ['species', 'scientific_name', 'is_blurred'])
+
+def _name(prefix, local):
+    return f"{{{NAMESPACES[prefix]}}}{local}"
+
+def xmp_paths(files, naming=ADOBE):
+    """Return the sidecar paths for a photo and its RAW files, which share one sidecar with ADOBE naming."""
+    if naming == DARKTABLE:
+        return [Path(f"{path}.xmp") for path in files]
+    return [Path(files[0]).with_suffix('.xmp')]
+
+def keywords(tags):
+    """The dc:subject keywords written for tags."""
+    words = [word for word in (tags.species, tags.scientific_name) if word]
+    if tags.is_blurred:
+        words.append(BLURRED_KEYWORD)
+    return words
+
+def read_xmp(path):
+    """Parse a sidecar and return its root element, registering the prefixes it uses so they are kept."""
+    data = Path(path).read_bytes()
+    for _, (prefix, uri) in ET.iterparse(io.BytesIO(data), events=['start-ns']):
+        if prefix and uri not in NAMESPACES.values():
+            try:
+                ET.register_namespace(prefix, uri)
+            except ValueError:
+                # Reserved ns0-style prefix, ElementTree picks one
+                pass
+    return ET.fromstring(data)
+
+def new_xmp():
+    root = ET.Element(_name('x', 'xmpmeta'))
+    ET.SubElement(root, _name('rdf', 'RDF'))
+    return root
+
+def recorded_tags(root):
+    """Return the XmpTags written into a sidecar by an earlier run, or None."""
+    for description in root.iter(_name('rdf', 'Description')):
+        species = description.get(_name('birdclassifier', 'Species'))
+        if species is not None:
+            return XmpTags(species or None, description.get(_name('birdclassifier', 'ScientificName')) or None,
+                           description.get(_name('birdclassifier', 'Blurred')) == 'True')
+    return None
+
+def apply_tags(root, tags, old_tags=None):
+    """Write tags into a parsed sidecar, replacing the keywords of old_tags and leaving everything else alone."""
+    rdf = root if root.tag == _name('rdf', 'RDF') else root.find(_name('rdf', 'RDF'))
+    if rdf is None:
+        rdf = ET.SubElement(root, _name('rdf', 'RDF'))
+    ours = None
+    for description in rdf.iter(_name('rdf', 'Description')):
+        if description.get(_name('birdclassifier', 'Species')) is not None:
+            ours = description
+    if ours is None:
+        ours = ET.SubElement(rdf, _name('rdf', 'Description'), {_name('rdf', 'about'): ''})
+    ours.set(_name('birdclassifier', 'Species'), tags.species or '')
+    ours.set(_name('birdclassifier', 'ScientificName'), tags.scientific_name or '')
+    ours.set(_name('birdclassifier', 'Blurred'), str(bool(tags.is_blurred)))
+
+    # Keywords go into the existing dc:subject bag, wherever the editing tool put it
+    subject = next(rdf.iter(_name('dc', 'subject')), None)
+    if subject is None:
+        subject = ET.SubElement(ours, _name('dc', 'subject'))
+    bag = subject.find(_name('rdf', 'Bag'))
+    if bag is None:
+        bag = ET.SubElement(subject, _name('rdf', 'Bag'))
+    stale = set(keywords(old_tags)) if old_tags else set()
+    for item in list(bag):
+        if item.text in stale:
+            bag.remove(item)
+    present = {item.text for item in bag}
+    for word in keywords(tags):
+        if word not in present:
+            ET.SubElement(bag, _name('rdf', 'li')).text = word
+
+def _write_atomic(path, root):
+    """Write a sidecar through a temporary file and os.replace, so it is always either the old or the new one."""
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(PACKET_HEADER)
+        f.write(ET.tostring(root, encoding='unicode'))
+        f.write(PACKET_TRAILER)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _sync_dir(directory):
+    """Make the renames in directory durable, where the platform allows it."""
+    if sys.platform.startswith('win'):
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+class SidecarWriter:
+    """Write the classification of photos into XMP sidecars next to them, in batches.
+
+    add() queues the tags of a photo, and every batch_size photos the
+    queued sidecars are written: each through a temporary file and an
+    atomic rename, with one fsync of each folder per batch instead of one
+    per file. A sidecar that already says what it would be told is not
+    rewritten, so a re-run only touches the photos whose classification
+    changed. Existing sidecars from Lightroom, darktable and the like are
+    merged into, keeping their develop settings and keywords.
+
+    scientific_name(species) returns the scientific name of a species, or
+    None while it is not known yet; photos of such species wait for a later
+    batch, flush(final=True) writes them regardless. Each flush returns the
+    tokens passed to add() for the photos whose sidecars are done; sidecars
+    that can't be written are reported on stderr and counted in failed.
+    """
+
+    def __init__(self, scientific_name, naming=ADOBE, batch_size=XMP_BATCH_SIZE):
+        self.scientific_name = scientific_name
+        self.naming = naming
+        self.batch_size = batch_size
+        self.queued = []
+        # Queued photos that were held back by the last flush
+        self.waiting = 0
+        self.written = 0
+        self.unchanged = 0
+        self.failed = 0
+
+    def add(self, files, species, is_blurred, token=None):
+        """Queue a photo (its file and RAW files), return the tokens of the photos written meanwhile."""
+        self.queued.append((files, species, is_blurred, token))
+        if len(self.queued) - self.waiting >= self.batch_size:
+            return self.flush()
+        return []
+
+    def flush(self, final=False):
+        batch = []
+        waiting = []
+        for files, species, is_blurred, token in self.queued:
+            scientific_name = self.scientific_name(species) if species else None
+            if species and scientific_name is None and not final:
+                waiting.append((files, species, is_blurred, token))
+            else:
+                batch.append((files, XmpTags(species, scientific_name, is_blurred), token))
+        self.queued = waiting
+        self.waiting = len(waiting)
+        if not batch:
+            return []
+        directories = set()
+        done = []
+        for files, tags, token in batch:
+            try:
+                for path in xmp_paths(files, self.naming):
+                    if self._write(path, tags):
+                        directories.add(path.parent)
+                done.append(token)
+            except (OSError, ET.ParseError) as e:
+                # Left alone rather than replaced, it may hold someone's edits
+                print(f"Error writing sidecar for {files[0]}: {str(e)}", file=sys.stderr)
+                self.failed += 1
+        for directory in directories:
+            _sync_dir(directory)
+        return done
+
+    def _write(self, path, tags):
+        """Bring one sidecar up to date, return whether it had to be written."""
+        if path.exists():
+            root = read_xmp(path)
+            old_tags = recorded_tags(root)
+            if old_tags and old_tags.species == tags.species and tags.species and not tags.scientific_name:
+                # Not fetched this time, what was written before still holds
+                tags = tags._replace(scientific_name=old_tags.scientific_name)
+            if old_tags == tags:
+                self.unchanged += 1
+                return False
+        else:
+            root = new_xmp()
+            old_tags = None
+        apply_tags(root, tags, old_tags)
+        _write_atomic(path, root)
+        self.written += 1
+        return True
+
+    def summary(self):
+        return {'written': self.written, 'unchanged': self.unchanged, 'failed': self.failed}